@@ -17,7 +17,10 @@ INSTALL_REQUIRES = [
     "pydantic==2.*",
 ]
 
+NUMPY_REQUIRES = ["numpy>=1.20"]
+
 DEV_REQUIRES = [
+    *NUMPY_REQUIRES,
     "pytest==8.*",
     "ruff==0.14.* ",
     "requests-mock==1.*",
@@ -48,7 +51,7 @@ setup(
     package_dir={"": "src"},
     packages=find_packages("src"),
     install_requires=INSTALL_REQUIRES,
-    extras_require=dict(dev=DEV_REQUIRES),
+    extras_require=dict(dev=DEV_REQUIRES, numpy=NUMPY_REQUIRES),
     entry_points={"console_scripts": ["underground = underground.cli.cli:entry_point"]},
     package_data={"underground": ["version"]},
     data_files=[("", ["readme.md"])],  # add the readme
@@ -2,8 +2,8 @@
 
 from pathlib import Path
 
-from .models import SubwayFeed
+from .models import LazySubwayFeed, SubwayFeed
 
 __version__ = (Path(__file__).resolve().parent / "version").read_text().strip()
 
-__all__ = ["SubwayFeed", "__version__"]
+__all__ = ["LazySubwayFeed", "SubwayFeed", "__version__"]
@@ -0,0 +1,398 @@
+"""Look up stops in the MTA static GTFS data, kept in a local catalog."""
+
+import concurrent.futures
+import contextlib
+import csv
+import dataclasses
+import functools
+import heapq
+import io
+import itertools
+import json
+import math
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import typing
+import zipfile
+
+import requests
+
+from underground import disk_cache, feed
+
+# url to the zip file containing MTA metadata
+# see "Static GTFS Data" at https://www.mta.info/developers
+DATA_URLS = {
+    # subway
+    "subway": "http://web.mta.info/developers/data/nyct/subway/google_transit.zip",
+    # buses
+    "buses_bx": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_bx.zip",
+    "buses_bk": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_b.zip",
+    "buses_m": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_m.zip",
+    "buses_q": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_q.zip",
+    "buses_si": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_si.zip",
+    "buses_busco": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_busco.zip",
+}
+
+# seconds after which the catalog is checked against the MTA data
+DEFAULT_TTL = 24 * 60 * 60
+
+# bytes read at a time when downloading the data
+CHUNK_SIZE = 1 << 16
+
+# size in degrees of the grid cells used to look up stops by location (about 500m)
+GRID_SIZE = 0.005
+
+# mean radius of the earth in meters
+EARTH_RADIUS = 6_371_000
+
+
+@dataclasses.dataclass(frozen=True)
+class Stop:
+    """A stop in the static GTFS data.
+
+    Parameters
+    ----------
+    stop_id : str
+        The stop ID, such as 'D27N'.
+    stop_name : str
+        The name of the stop, such as 'Parkside Av'.
+    direction : str
+        'NORTH' or 'SOUTH' for subway stops, '(BUS)' for bus stops.
+    stop_lat : float
+        Latitude of the stop.
+    stop_lon : float
+        Longitude of the stop.
+    source : str
+        Key of the data source in ``DATA_URLS``.
+
+    """
+
+    stop_id: str
+    stop_name: str
+    direction: str
+    stop_lat: float
+    stop_lon: float
+    source: str
+
+
+def parse_stops(zpfile: zipfile.ZipFile, source: str) -> list[Stop]:
+    """Read the stops in a static GTFS zip file, skipping stations."""
+    with zpfile.open("stops.txt") as file:
+        return list(_parse_stops(io.TextIOWrapper(file, encoding="utf-8", newline=""), source))
+
+
+def _parse_stops(stops_txt: typing.TextIO, source: str) -> typing.Iterator[Stop]:
+    """Read the stops in a stops.txt file, one row at a time."""
+    for row in csv.DictReader(stops_txt):
+        # skip stations, i only want stop info.
+        if row.get("location_type") == "1":
+            continue
+
+        # parse stop direction
+        if source != "subway":
+            direction = "(BUS)"
+        elif row["stop_id"].endswith("N"):
+            direction = "NORTH"
+        elif row["stop_id"].endswith("S"):
+            direction = "SOUTH"
+        else:
+            raise ValueError(f"Cannot parse direction: {row['stop_id']}.")
+
+        yield Stop(
+            stop_id=row["stop_id"],
+            stop_name=row["stop_name"],
+            direction=direction,
+            stop_lat=float(row["stop_lat"]),
+            stop_lon=float(row["stop_lon"]),
+            source=source,
+        )
+
+
+def _write_response(res: requests.Response, file: typing.BinaryIO) -> None:
+    """Write the body of a streamed response to a file, a chunk at a time."""
+    for chunk in res.iter_content(CHUNK_SIZE):
+        file.write(chunk)
+
+
+def request_zip(url: str, session: typing.Optional[requests.Session] = None) -> zipfile.ZipFile:
+    """Request a zip file, such as the MTA static data, without holding it in memory.
+
+    The download is streamed to an anonymous temporary file, which the returned zip file
+    reads from, and which is deleted once the zip file is no longer used.
+
+    Parameters
+    ----------
+    url : str
+        The url of the zip file.
+    session : requests.Session, optional
+        Session used to request the file. Default the shared feed session.
+
+    Returns
+    -------
+    zipfile.ZipFile
+        The zip file, open for reading.
+
+    """
+    with contextlib.ExitStack() as stack:
+        file = stack.enter_context(tempfile.TemporaryFile())
+        with (session or feed.get_session()).get(url, stream=True) as res:
+            res.raise_for_status()
+            _write_response(res, file)
+        zpfile = zipfile.ZipFile(file)
+        stack.pop_all()  # keep the file open for the zip file
+    return zpfile
+
+
+def index_names(stops: list[Stop]) -> dict[str, list[int]]:
+    """Map each word in the stop names (lowercase) to the positions of the stops."""
+    index: dict[str, list[int]] = {}
+    for i, stop in enumerate(stops):
+        for word in dict.fromkeys(stop.stop_name.lower().split()):
+            index.setdefault(word, []).append(i)
+    return index
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Return the great circle distance in meters between two points (haversine)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2
+    a += math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def _cell(lat: float, lon: float) -> tuple[int, int]:
+    """Return the grid cell holding a point."""
+    return math.floor(lat / GRID_SIZE), math.floor(lon / GRID_SIZE)
+
+
+def sources(include_buses: bool = False) -> list[str]:
+    """Return the keys of the data sources in ``DATA_URLS``: subway, and maybe buses."""
+    return list(DATA_URLS) if include_buses else ["subway"]
+
+
+@dataclasses.dataclass
+class _Table:
+    """The stops from one data source, as kept on disk."""
+
+    url: str
+    stops: list[Stop]
+    index: dict[str, list[int]]
+    fetched_at: float
+    etag: typing.Optional[str] = None
+    last_modified: typing.Optional[str] = None
+
+    def to_json(self) -> dict:
+        """Return the table as JSON, with stops as rows of values."""
+        stops = [dataclasses.astuple(x)[:-1] for x in self.stops]
+        return {**dataclasses.asdict(self), "stops": stops}
+
+    @functools.cached_property
+    def grid(self) -> dict[tuple[int, int], list[int]]:
+        """Map grid cells (see ``_cell``) to the positions of the stops in them."""
+        grid: dict[tuple[int, int], list[int]] = {}
+        for i, stop in enumerate(self.stops):
+            grid.setdefault(_cell(stop.stop_lat, stop.stop_lon), []).append(i)
+        return grid
+
+    @classmethod
+    def from_json(cls, data: dict, source: str) -> "_Table":
+        """Read a table from JSON. See ``to_json``."""
+        stops = [Stop(*row, source=source) for row in data["stops"]]
+        return cls(**{**data, "stops": stops})
+
+
+class StopCatalog:
+    """The stops in the MTA static GTFS data, kept on disk for fast and offline lookups.
+
+    The stops from each data source are downloaded the first time they are needed, and
+    kept in a JSON file along with an index of the words in their names. After ``ttl``
+    seconds, the data are requested again, and the catalog is rebuilt only if they have
+    changed. If they cannot be requested, the old catalog is used.
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds after which to check the catalog against the MTA data. Default one day.
+    directory : path, optional
+        Directory for the catalog files. Default ``underground/catalog`` in the XDG cache
+        directory (usually ``~/.cache/underground/catalog``).
+    session : requests.Session, optional
+        Session used to request the data. Default the shared feed session.
+
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        directory: typing.Optional[typing.Union[str, os.PathLike]] = None,
+        session: typing.Optional[requests.Session] = None,
+    ):
+        self.ttl = ttl
+        self.directory = pathlib.Path(directory or disk_cache.default_directory() / "catalog")
+        self.session = session
+        self._tables: dict[str, _Table] = {}
+        self._locks = {source: threading.Lock() for source in DATA_URLS}
+
+    def path(self, source: str) -> pathlib.Path:
+        """Return the path of the catalog file for a data source."""
+        return self.directory / f"stops_{source}.json"
+
+    def _expired(self, table: typing.Optional[_Table]) -> bool:
+        """Return whether a table is missing or due to be checked."""
+        return table is None or time.time() - table.fetched_at > self.ttl
+
+    def _read(self, source: str) -> typing.Optional[_Table]:
+        """Read the table for a data source from disk, if there is a valid one."""
+        try:
+            with open(self.path(source), "rb") as file:
+                table = _Table.from_json(json.load(file), source)
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+        return table if table.url == DATA_URLS[source] else None
+
+    def _download(self, source: str, table: typing.Optional[_Table]) -> _Table:
+        """Request the data for a source, reusing a table if they have not changed."""
+        headers = {}
+        if table is not None and table.etag is not None:
+            headers["If-None-Match"] = table.etag
+        if table is not None and table.last_modified is not None:
+            headers["If-Modified-Since"] = table.last_modified
+
+        url = DATA_URLS[source]
+        session = self.session or feed.get_session()
+        with session.get(url, headers=headers, stream=True) as res:
+            res.raise_for_status()
+            if res.status_code == 304 and table is not None:
+                return dataclasses.replace(table, fetched_at=time.time())
+
+            # stream to disk rather than holding the whole zip file in memory
+            with tempfile.TemporaryFile() as file:
+                _write_response(res, file)
+                with zipfile.ZipFile(file) as zpfile:
+                    stops = parse_stops(zpfile, source)
+
+        return _Table(
+            url=url,
+            stops=stops,
+            index=index_names(stops),
+            fetched_at=time.time(),
+            etag=res.headers.get("ETag"),
+            last_modified=res.headers.get("Last-Modified"),
+        )
+
+    def _table(self, source: str, refresh: bool = False) -> _Table:
+        """Return the table for a data source, updating it first if needed."""
+        with self._locks[source]:
+            table = self._tables.get(source)
+            if not refresh and not self._expired(table):
+                return table
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with disk_cache.file_lock(self.path(source).with_suffix(".lock")):
+                # another process may have updated the file
+                table = self._read(source)
+                if refresh or self._expired(table):
+                    try:
+                        table = self._download(source, table)
+                    except requests.RequestException:
+                        if table is None:
+                            raise
+                    else:
+                        content = json.dumps(table.to_json(), separators=(",", ":")).encode()
+                        disk_cache.write_atomic(self.path(source), content)
+
+            self._tables[source] = table
+            return table
+
+    def _load(self, include_buses: bool, refresh: bool = False) -> list[_Table]:
+        """Return the tables for the data sources, updating them in parallel if needed.
+
+        Tables are returned in the order of the data sources in ``DATA_URLS``.
+        """
+        names = sources(include_buses)
+        with concurrent.futures.ThreadPoolExecutor(len(names)) as executor:
+            return list(executor.map(functools.partial(self._table, refresh=refresh), names))
+
+    def refresh(self, include_buses: bool = False):
+        """Check the catalog against the MTA data now, regardless of the ttl."""
+        self._load(include_buses, refresh=True)
+
+    def stops(self, include_buses: bool = False) -> list[Stop]:
+        """Return all stops, in the order of the data sources and their files."""
+        return [x for table in self._load(include_buses) for x in table.stops]
+
+    def search(self, query: str, include_buses: bool = False) -> list[Stop]:
+        """Return the stops with names containing a query (case insensitive)."""
+        query = query.lower().strip()
+        if not query:
+            return self.stops(include_buses)
+
+        # the longest word in the query is part of a word in each matching name
+        longest = max(query.split(), key=len)
+        matches = []
+        for table in self._load(include_buses):
+            positions = {i for word, ix in table.index.items() if longest in word for i in ix}
+            stops = (table.stops[i] for i in sorted(positions))
+            matches.extend(x for x in stops if query in x.stop_name.lower())
+        return matches
+
+    def near(
+        self,
+        lat: float,
+        lon: float,
+        radius: float = 400,
+        limit: typing.Optional[int] = None,
+        include_buses: bool = False,
+    ) -> list[tuple[float, Stop]]:
+        """Return the stops within a distance of a point, nearest first.
+
+        Only stops in the grid cells overlapping the radius are measured, so lookups do
+        not scan the whole catalog.
+
+        Parameters
+        ----------
+        lat : float
+            Latitude of the point.
+        lon : float
+            Longitude of the point.
+        radius : float
+            Distance in meters within which to return stops. Default 400.
+        limit : int, optional
+            Maximum number of stops to return. All within the radius if not provided.
+        include_buses : bool
+            Option to include bus stops. Default False.
+
+        Returns
+        -------
+        list of tuple
+            Distances in meters and stops, ordered by distance.
+
+        """
+        # degrees spanned by the radius, with longitude degrees narrowest nearest a pole
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        cos_lat = math.cos(math.radians(min(90, abs(lat) + dlat)))
+        dlon = 180 if cos_lat < 1e-9 else min(180, dlat / cos_lat)
+        lat_min, lon_min = _cell(lat - dlat, lon - dlon)
+        lat_max, lon_max = _cell(lat + dlat, lon + dlon)
+        lat_cells, lon_cells = range(lat_min, lat_max + 1), range(lon_min, lon_max + 1)
+
+        found = []
+        for table in self._load(include_buses):
+            if len(lat_cells) * len(lon_cells) <= len(table.grid):
+                cells = itertools.product(lat_cells, lon_cells)
+            else:  # fewer cells with stops than cells in range
+                cells = (x for x in table.grid if x[0] in lat_cells and x[1] in lon_cells)
+
+            for cell in cells:
+                for position in table.grid.get(cell, ()):
+                    stop = table.stops[position]
+                    meters = distance(lat, lon, stop.stop_lat, stop.stop_lon)
+                    if meters <= radius:
+                        found.append((meters, stop))
+
+        if limit is None:
+            return sorted(found, key=lambda x: x[0])
+        return heapq.nsmallest(limit, found, key=lambda x: x[0])
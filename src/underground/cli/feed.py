@@ -5,6 +5,7 @@ import json
 import click
 
 from underground import feed
+from underground.cli.options import cache_option, rate_limit_option, retry_options
 
 
 @click.command()
@@ -21,9 +22,12 @@ from underground import feed
     "retries",
     default=100,
     type=int,
-    help="Retry attempts in case of API connection failure. Default 100.",
+    help="Retry attempts in case of incomplete feed data. Default 100.",
 )
-def main(route_or_url: str, output_json: bool, retries: int):
+@retry_options
+@cache_option
+@rate_limit_option
+def main(route_or_url: str, output_json: bool, retries: int, retry_policy: feed.RetryPolicy):
     """Request an MTA feed via a route or URL.
 
     ROUTE_OR_URL may be either a feed URL or a route (which will be used to look up
@@ -38,7 +42,12 @@ def main(route_or_url: str, output_json: bool, retries: int):
       URL='https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds/nyct%2Fgtfs-nqrw' &&
       underground feed $URL --json > feed_nrqw.json
     """
-    data = feed.request_robust(route_or_url=route_or_url, retries=retries, return_dict=output_json)
+    data = feed.request_robust(
+        route_or_url=route_or_url,
+        retries=retries,
+        return_dict=output_json,
+        retry_policy=retry_policy,
+    )
     if output_json:
         click.echo(json.dumps(data))
     else:
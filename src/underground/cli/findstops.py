@@ -1,52 +1,37 @@
 """Get upcoming stops along a train route."""
 
-import csv
-import io
+import dataclasses
 import json
 import zipfile
-from collections.abc import Generator
+from typing import Optional
 
 import click
 import requests
 
-# url to the zip file containing MTA metadata
-# see "Static GTFS Data" at https://www.mta.info/developers
-DATA_URLS = {
-    # subway
-    "subway": "http://web.mta.info/developers/data/nyct/subway/google_transit.zip",
-    # buses
-    "buses_bx": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_bx.zip",
-    "buses_bk": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_b.zip",
-    "buses_m": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_m.zip",
-    "buses_q": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_q.zip",
-    "buses_si": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_si.zip",
-    "buses_busco": "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_busco.zip",
-}
+from underground.catalog import DATA_URLS, StopCatalog, request_zip
 
+# DATA_URLS moved to the catalog module, and is still exported here for compatibility
+__all__ = ["DATA_URLS", "main", "parse_point", "request_data"]
 
-def request_data(url: str) -> zipfile.ZipFile:
-    """Request the metadata zip file from the MTA."""
-    res = requests.get(url)
-    res.raise_for_status()
-    return zipfile.ZipFile(io.BytesIO(res.content))
 
+def request_data(url: str, session: Optional[requests.Session] = None) -> zipfile.ZipFile:
+    """Request the metadata zip file from the MTA. See ``catalog.request_zip``."""
+    return request_zip(url, session)
 
-def get_stops(include_buses: bool) -> Generator[dict[str, str], None, None]:
-    for source, url in DATA_URLS.items():
-        zpfile = request_data(url)
-        stops_txt = io.StringIO(zpfile.read("stops.txt").decode())
 
-        def add_source(row: dict[str, str]) -> dict[str, str]:
-            return {"_source": source, **row}  # noqa: B023
-
-        yield from map(add_source, csv.DictReader(stops_txt))
-
-        if not include_buses:
-            break
+def parse_point(ctx, param, value: Optional[str]) -> Optional[tuple[float, float]]:
+    """Parse a LAT,LON option value."""
+    if value is None:
+        return None
+    try:
+        lat, lon = map(float, value.split(","))
+    except ValueError:
+        raise click.BadParameter("Must be LAT,LON, like 40.655,-73.961.") from None
+    return lat, lon
 
 
 @click.command()
-@click.argument("query", required=True, nargs=-1, type=str)
+@click.argument("query", required=False, nargs=-1, type=str)
 @click.option(
     "--json",
     "output_json",
@@ -58,50 +43,73 @@ def get_stops(include_buses: bool) -> Generator[dict[str, str], None, None]:
     "--buses",
     "include_buses",
     is_flag=True,
-    help="Option to also search bus stops. Slower.",
+    help="Option to also search bus stops.",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Option to check the local stop catalog against the MTA data now.",
+)
+@click.option(
+    "--near",
+    "near",
+    default=None,
+    metavar="LAT,LON",
+    callback=parse_point,
+    help="Option to find stops near a point instead, nearest first.",
+)
+@click.option(
+    "--radius",
+    "radius",
+    default=400.0,
+    type=click.FloatRange(0),
+    help="Distance in meters within which to find stops with --near. Default 400.",
 )
-def main(query, output_json, include_buses):
+@click.option(
+    "--limit",
+    "limit",
+    default=None,
+    type=click.IntRange(1),
+    help="Maximum number of stops to find. No limit by default.",
+)
+def main(query, output_json, include_buses, refresh, near, radius, limit):
     """Find your stop ID.
 
     Query a location and look for your stop ID, like:
 
     $ underground findstops parkside av
+
+    Or look for stops near a point, optionally matching a query too, like:
+
+    $ underground findstops --near 40.655,-73.961 --radius 500
+
+    Stops are looked up in a local catalog of the MTA static data, which is downloaded
+    on first use and checked for updates daily.
     """
     query_str = " ".join(query).lower().strip()  # make into single string
-
-    all_stops = get_stops(include_buses)
-
-    matched_stops = []
-    # iterate using dictreader
-    for stop in all_stops:
-        # skip stations, i only want stop info.
-        if stop.get("location_type") == "1":
-            continue
-
-        # parse stop direction
-        if stop["_source"] != "subway":
-            direction = "(BUS)"
-        elif stop["stop_id"].endswith("N"):
-            direction = "NORTH"
-        elif stop["stop_id"].endswith("S"):
-            direction = "SOUTH"
+    if not query_str and near is None:
+        raise click.UsageError("Provide a QUERY or --near.")
+
+    catalog = StopCatalog()
+    if refresh:
+        catalog.refresh(include_buses)
+
+    if near is None:
+        matched_stops = [
+            dict(dataclasses.asdict(stop), stop_name=stop.stop_name.upper())
+            for stop in catalog.search(query_str, include_buses)[:limit]
+        ]
+    else:
+        if query_str:
+            # filter by name before the limit, so that it counts matching stops
+            found = catalog.near(*near, radius=radius, include_buses=include_buses)
+            found = [x for x in found if query_str in x[1].stop_name.lower()][:limit]
         else:
-            raise ValueError(f"Cannot parse direction: {stop['stop_id']}.")
-
-        stop["direction"] = direction
-
-        # add if match
-        if query_str in stop["stop_name"].lower():
-            matched_stops.append(
-                dict(
-                    stop_id=stop["stop_id"],
-                    stop_name=stop["stop_name"].upper(),
-                    direction=stop["direction"].upper(),
-                    stop_lat=float(stop["stop_lat"]),
-                    stop_lon=float(stop["stop_lon"]),
-                    source=stop["_source"],
-                )
-            )
+            found = catalog.near(*near, radius=radius, limit=limit, include_buses=include_buses)
+        matched_stops = [
+            dict(dataclasses.asdict(stop), stop_name=stop.stop_name.upper(), distance=meters)
+            for meters, stop in found
+        ]
 
     if not output_json:
         for stop in matched_stops:
@@ -110,7 +118,8 @@ def main(query, output_json, include_buses):
                 f"""Direction: {stop["direction"]}    """
                 + (f"""Data Source: {stop["source"]:<12} """ if include_buses else "")
                 + f"""Lat/Lon: {stop["stop_lat"]:<9},{stop["stop_lon"]:<10}  """
-                f"""Name: {stop["stop_name"]}    """
+                + (f"""Distance: {stop["distance"]:>4.0f}m  """ if near else "")
+                + f"""Name: {stop["stop_name"]}    """
             )
     else:
         click.echo(json.dumps(matched_stops))
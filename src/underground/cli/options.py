@@ -0,0 +1,144 @@
+"""Options shared by the commands which request feeds."""
+
+import functools
+import typing
+
+import click
+
+from underground import disk_cache, feed, rate_limit
+
+_RETRY_OPTIONS = [
+    click.option(
+        "--retry-delay",
+        "retry_delay",
+        default=1.0,
+        type=click.FloatRange(0),
+        help="Seconds to wait before the first retry. Default 1.",
+    ),
+    click.option(
+        "--retry-backoff",
+        "retry_backoff",
+        default=1.0,
+        type=click.FloatRange(1),
+        help="Factor by which the wait grows after each retry. Default 1.",
+    ),
+    click.option(
+        "--retry-max-delay",
+        "retry_max_delay",
+        default=30.0,
+        type=click.FloatRange(0),
+        help="Maximum seconds to wait between retries. Default 30.",
+    ),
+    click.option(
+        "--retry-jitter",
+        "retry_jitter",
+        default=0.0,
+        type=click.FloatRange(0, 1),
+        help="Maximum fraction of each wait which is randomly skipped. Default 0.",
+    ),
+    click.option(
+        "--deadline",
+        "deadline",
+        default=None,
+        type=click.FloatRange(0),
+        help="Seconds after which to stop retrying. No limit by default.",
+    ),
+    click.option(
+        "--http-retries",
+        "http_retries",
+        default=0,
+        type=click.IntRange(0),
+        help="Retry attempts after connection errors, timeouts and 429/5xx responses. Default 0.",
+    ),
+]
+
+
+def retry_options(func: typing.Callable) -> typing.Callable:
+    """Add options configuring retries to a command.
+
+    The options are passed to the command as a single ``retry_policy`` argument.
+    """
+
+    @functools.wraps(func)
+    def wrapper(
+        *args,
+        retry_delay: float,
+        retry_backoff: float,
+        retry_max_delay: float,
+        retry_jitter: float,
+        deadline: typing.Optional[float],
+        http_retries: int,
+        **kwargs,
+    ):
+        retry_policy = feed.RetryPolicy(
+            delay=retry_delay,
+            multiplier=retry_backoff,
+            max_delay=retry_max_delay,
+            jitter=retry_jitter,
+            deadline=deadline,
+            http_retries=http_retries,
+        )
+        return func(*args, retry_policy=retry_policy, **kwargs)
+
+    for option in reversed(_RETRY_OPTIONS):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def cache_option(func: typing.Callable) -> typing.Callable:
+    """Add an option to serve recent feed data from a cache on disk.
+
+    The cache is set for the duration of the command (see ``feed.set_disk_cache``).
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, cache_ttl: typing.Optional[float], **kwargs):
+        if cache_ttl is None:
+            return func(*args, **kwargs)
+
+        feed.set_disk_cache(disk_cache.DiskCache(ttl=cache_ttl))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            feed.set_disk_cache(None)
+
+    return click.option(
+        "--cache-ttl",
+        "cache_ttl",
+        default=None,
+        type=click.FloatRange(0),
+        envvar="UNDERGROUND_CACHE_TTL",
+        help=(
+            "Seconds for which feed data are served from a cache on disk, shared between "
+            "calls. Off by default."
+        ),
+    )(wrapper)
+
+
+def rate_limit_option(func: typing.Callable) -> typing.Callable:
+    """Add an option to limit the rate of requests to each feed, across processes.
+
+    The limit is set for the duration of the command (see ``feed.set_rate_limiter``).
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, rate: typing.Optional[float], **kwargs):
+        if rate is None:
+            return func(*args, **kwargs)
+        if rate == 0:
+            raise click.BadParameter("Must be positive.", param_hint="'--rate-limit'")
+
+        feed.set_rate_limiter(rate_limit.RateLimiter(rate=rate, shared=True))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            feed.set_rate_limiter(None)
+
+    return click.option(
+        "--rate-limit",
+        "rate",
+        default=None,
+        type=click.FloatRange(0),
+        envvar="UNDERGROUND_RATE_LIMIT",
+        help="Requests per second allowed to each feed, shared between calls. No limit by default.",
+    )(wrapper)
@@ -1,21 +1,62 @@
 """Get upcoming stops along a train route."""
 
+import concurrent.futures
 import datetime
+import functools
+import heapq
+import itertools
+import typing
 import zoneinfo
 
 import click
 
-from underground import metadata
+from underground import feed, metadata
+from underground.cli.options import cache_option, rate_limit_option, retry_options
 from underground.models import SubwayFeed
 
 
-def datetime_to_epoch(dttm: datetime.datetime) -> int:
-    """Return a unix timestmap from a datetime."""
-    return int(dttm.astimezone(zoneinfo.ZoneInfo("UTC")).timestamp())
+def epoch_formatter(fmt: str, timezone: str) -> typing.Callable[[int], str]:
+    """Return a function formatting unix timestamps, per the stops ``--format`` option.
+
+    Timezone conversion only happens here, at the output edge. Formatted values are
+    cached, since many stop times share a timestamp.
+    """
+    if fmt == "epoch":
+        return str
+
+    tz = zoneinfo.ZoneInfo(timezone)
+
+    @functools.cache
+    def format_epoch(epoch: int) -> str:
+        return datetime.datetime.fromtimestamp(epoch, tz).strftime(fmt)
+
+    return format_epoch
+
+
+def group_routes(
+    routes: typing.Sequence[str], all_routes: bool, bus: bool
+) -> dict[str, typing.Optional[set[str]]]:
+    """Map each feed url to request to its routes, or None for every route in the feed."""
+    if bus:
+        return {metadata.BUS_URL: None if all_routes else set(routes)}
+    if all_routes:
+        return dict.fromkeys(metadata.ROUTE_FEED_MAP.values())
+
+    urls: dict[str, typing.Optional[set[str]]] = {}
+    for route in routes:
+        urls.setdefault(metadata.resolve_url(route), set()).add(route)
+    return urls
 
 
 @click.command()
-@click.argument("route", type=str, nargs=1)
+@click.argument("routes", type=str, nargs=-1)
+@click.option(
+    "-a",
+    "--all",
+    "all_routes",
+    is_flag=True,
+    help="Print stops for all routes (all subway routes, or all bus routes if --bus).",
+)
 @click.option(
     "-f",
     "--format",
@@ -30,7 +71,7 @@ def datetime_to_epoch(dttm: datetime.datetime) -> int:
     "retries",
     default=100,
     type=int,
-    help="Retry attempts in case of API connection failure. Default 100.",
+    help="Retry attempts in case of incomplete feed data. Default 100.",
 )
 @click.option(
     "-t",
@@ -48,23 +89,75 @@ def datetime_to_epoch(dttm: datetime.datetime) -> int:
     " update before considering a train stalled. Default is 90 as recommended"
     " by the MTA. Numbers less than 1 disable this check.",
 )
-@click.option("--bus", is_flag=True, help="Set if the route is a bus route.")
-def main(route: str, fmt: str, retries: int, timezone: str, stalled_timeout: int, bus: bool):
-    """Print out train departure times for all stops on a subway line."""
-    route_or_url = route if not bus else metadata.BUS_URL
-    stops = (
-        SubwayFeed.get(route_or_url=route_or_url, retries=retries)
-        .extract_stop_dict(timezone=timezone, stalled_timeout=stalled_timeout)
-        .get(route, dict())
-    )
+@click.option(
+    "--stop",
+    "stop_ids",
+    multiple=True,
+    metavar="STOP_ID",
+    help="Only print this stop. Repeat for several stops. Default all stops.",
+)
+@click.option(
+    "-n",
+    "--limit",
+    "limit",
+    default=None,
+    type=click.IntRange(1),
+    help="Only print the next N departures from each stop. Default all departures.",
+)
+@click.option("--bus", is_flag=True, help="Set if the routes are bus routes.")
+@retry_options
+@cache_option
+@rate_limit_option
+def main(
+    routes: tuple[str, ...],
+    all_routes: bool,
+    fmt: str,
+    retries: int,
+    timezone: str,
+    stalled_timeout: int,
+    stop_ids: tuple[str, ...],
+    limit: typing.Optional[int],
+    bus: bool,
+    retry_policy: feed.RetryPolicy,
+):
+    """Print out train departure times for all stops on subway lines.
+
+    Each feed is requested once, however many of ROUTES it serves. If there is more than
+    one route, each line starts with its route.
+    """
+    if bool(routes) == all_routes:
+        raise click.UsageError("Provide either ROUTES or --all.")
+
+    urls = group_routes(routes, all_routes, bus)
+
+    def extract(url: str) -> dict[str, dict[str, list[int]]]:
+        sw_feed = SubwayFeed.get(
+            route_or_url=url, retries=retries, routes=urls[url], retry_policy=retry_policy
+        )
+        return sw_feed.extract_stop_epochs(
+            stalled_timeout=stalled_timeout, stop_ids=stop_ids or None, limit=limit
+        )
+
+    # request the feeds concurrently, merging routes reported by more than one feed
+    stops: dict[str, dict[str, list[int]]] = {}
+    with concurrent.futures.ThreadPoolExecutor(len(urls)) as executor:
+        for feed_stops in executor.map(extract, urls):
+            for route, route_stops in feed_stops.items():
+                merged = stops.setdefault(route, {})
+                for stop_id, departures in route_stops.items():
+                    if stop_id in merged:
+                        departures = heapq.merge(merged[stop_id], departures)
+                    merged[stop_id] = list(itertools.islice(departures, limit))
 
     # figure out how to format it
-    format_fun = datetime_to_epoch if fmt == "epoch" else lambda x: x.strftime(fmt)
+    format_fun = epoch_formatter(fmt, timezone)
 
-    # echo the result
-    for stop_id, departures in stops.items():
-        departures_formatted = map(str, map(format_fun, sorted(departures)))
-        click.echo(f"""{stop_id} {" ".join(departures_formatted)}""")
+    # echo the result, departures are already sorted
+    labelled = all_routes or len(set(routes)) > 1
+    for route in sorted(stops) if all_routes else dict.fromkeys(routes):
+        prefix = f"{route} " if labelled else ""
+        for stop_id, departures in stops.get(route, {}).items():
+            click.echo(f"""{prefix}{stop_id} {" ".join(map(format_fun, departures))}""")
 
 
 if __name__ == "__main__":
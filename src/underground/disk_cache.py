@@ -0,0 +1,113 @@
+"""Share recently requested feed data between processes, through files on disk."""
+
+import contextlib
+import hashlib
+import os
+import pathlib
+import tempfile
+import time
+import typing
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+
+def default_directory() -> pathlib.Path:
+    """Return the cache directory, per the XDG base directory specification."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return pathlib.Path(base) / "underground"
+
+
+@contextlib.contextmanager
+def file_lock(path: typing.Union[str, os.PathLike]) -> typing.Iterator[None]:
+    """Hold an exclusive lock on a file, shared by threads and processes.
+
+    The file is created if needed. Locking is not supported on platforms without
+    ``fcntl`` (i.e., Windows), where this does nothing.
+    """
+    with open(path, "ab") as file:
+        if fcntl is None:
+            yield
+            return
+
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def write_atomic(path: pathlib.Path, content: bytes) -> None:
+    """Write a file by renaming a complete temporary file over it.
+
+    Readers see either the old file or the new one, never part of either.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", delete=False) as file:
+        try:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+
+
+class DiskCache:
+    """Raw feed data kept on disk for a short time, keyed by feed url.
+
+    Each url is kept in its own file holding the protobuf data as served, so files can
+    be read directly or memory mapped (see ``path``). Files are replaced atomically, and
+    requests for a url hold a lock file, so that concurrent processes wait for one
+    download rather than each making their own.
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds for which data are served from the cache. Default 30.
+    directory : path, optional
+        Directory for the cache files. Default ``underground`` in the XDG cache
+        directory (usually ``~/.cache/underground``).
+
+    """
+
+    def __init__(
+        self, ttl: float = 30, directory: typing.Optional[typing.Union[str, os.PathLike]] = None
+    ):
+        self.ttl = ttl
+        self.directory = pathlib.Path(directory) if directory else default_directory()
+
+    def path(self, url: str) -> pathlib.Path:
+        """Return the path of the file holding the data for a url."""
+        name = hashlib.sha256(url.encode()).hexdigest()[:32]
+        return self.directory / f"{name}.pb"
+
+    def get(self, url: str) -> typing.Optional[bytes]:
+        """Return the data for a url, or None if there are none younger than the ttl."""
+        path = self.path(url)
+        try:
+            with open(path, "rb") as file:
+                if time.time() - os.fstat(file.fileno()).st_mtime > self.ttl:
+                    return None
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url: str, content: bytes) -> None:
+        """Store the data for a url."""
+        write_atomic(self.path(url), content)
+
+    def discard(self, url: str) -> None:
+        """Remove the data for a url, such as after finding them incomplete."""
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path(url))
+
+    @contextlib.contextmanager
+    def lock(self, url: str) -> typing.Iterator[None]:
+        """Hold the lock for requesting a url."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.path(url).with_suffix(".lock")):
+            yield
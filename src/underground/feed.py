@@ -1,35 +1,451 @@
 """Interact with the MTA GTFS api."""
 
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import dataclasses
+import functools
+import hashlib
+import math
+import random
+import threading
 import time
 import typing
+import weakref
 
 import google
 import protobuf_to_dict
 import requests
+import requests.adapters
 from google.transit import gtfs_realtime_pb2
 
-from underground import metadata
+from underground import disk_cache, metadata, rate_limit
 
+# field numbers from gtfs-realtime.proto, used to scan feeds without fully parsing them
+_FEED_HEADER = 1
+_FEED_ENTITY = 2
+_HEADER_TIMESTAMP = 3
+_ENTITY_TRIP_UPDATE = 3
+_ENTITY_VEHICLE = 4
+_TRIP = 1  # same number in TripUpdate and VehiclePosition
+_TRIP_ROUTE_ID = 5
+_WIRE_VARINT = 0
+_WIRE_LENGTH_DELIMITED = 2
 
-class EmptyFeedError(Exception):
+# default number of pooled connections per host for feed sessions
+DEFAULT_POOL_SIZE = 10
+
+# default (connect, read) timeouts in seconds for feed sessions
+DEFAULT_TIMEOUT = (5, 30)
+
+# upper bounds in seconds of latency histogram buckets, from 10ms to ~30s
+DEFAULT_LATENCY_BUCKETS = tuple(0.01 * 2 ** (n / 2) for n in range(24))
+
+_session: typing.Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# request latencies per url, and the policy for hedging requests
+_latencies: dict[str, "LatencyHistogram"] = {}
+_hedge_policy: typing.Optional["HedgePolicy"] = None
+_hedge_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+# optional cache of feed data shared with other processes
+_disk_cache: typing.Optional["disk_cache.DiskCache"] = None
+
+# optional limit on the rate of requests to each feed
+_rate_limiter: typing.Optional["rate_limit.RateLimiter"] = None
+
+# the last response per url and the results of loading it, least recently used first
+_cache: "collections.OrderedDict[str, _CachedFeed]" = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+# number of urls, and of loaded results per url, kept in the cache
+CACHE_SIZE = 32
+CACHE_LOADERS = 8
+
+# whether loaded results are kept in the cache (see set_result_cache)
+_cache_results = False
+
+
+class InvalidFeedError(Exception):
+    """Thrown when the GTFS data fail validation."""
+
+
+class EmptyFeedError(InvalidFeedError):
     """Thrown when the GTFS data is empty."""
 
 
-def load_protobuf(protobuf_bytes: bytes) -> dict:
+class StaleFeedError(InvalidFeedError):
+    """Thrown when the GTFS data are older than allowed."""
+
+
+class RateLimitedError(Exception):
+    """Thrown when the rate limit does not allow a request before the retry deadline."""
+
+
+@dataclasses.dataclass(frozen=True)
+class ValidationPolicy:
+    """Checks that feed data must pass to be accepted by ``request_robust``.
+
+    Feeds requested while the MTA is writing them can be cut off after any entity, which
+    still parses; a minimum entity count catches most of these. Checking the age of the
+    header catches feeds which have stopped updating.
+
+    Parameters
+    ----------
+    min_entities : int
+        Minimum number of entities in the feed. Default 1.
+    max_age : float, optional
+        Maximum age of the feed header timestamp, in seconds. Not checked if not
+        provided.
+
+    """
+
+    min_entities: int = 1
+    max_age: typing.Optional[float] = None
+
+    def check_entities(self, count: int) -> None:
+        """Raise if a feed has too few entities."""
+        if not count:
+            raise EmptyFeedError
+        if count < self.min_entities:
+            raise InvalidFeedError(f"Feed has {count} entities, need {self.min_entities}.")
+
+    def check_timestamp(self, timestamp: typing.Optional[int]) -> None:
+        """Raise if a feed header timestamp is missing or too old."""
+        if self.max_age is None:
+            return
+        if not timestamp:
+            raise StaleFeedError("Feed has no header timestamp.")
+        age = time.time() - timestamp
+        if age > self.max_age:
+            raise StaleFeedError(f"Feed is {age:.0f} seconds old, limit {self.max_age}.")
+
+
+DEFAULT_POLICY = ValidationPolicy()
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    """How ``request_robust`` waits between retries, and when it gives up.
+
+    The wait before the n-th retry is ``delay * multiplier ** (n - 1)``, up to
+    ``max_delay``, and then reduced by a random fraction of up to ``jitter`` so that
+    many clients do not retry in lockstep. The defaults wait 1 second between retries.
+
+    Incomplete feed data (see ``ValidationPolicy``) are retried up to the ``retries``
+    argument of ``request_robust``. HTTP errors are counted separately: connection
+    errors, timeouts, 429 and 5xx responses are retried up to ``http_retries`` times, and
+    other HTTP errors are raised immediately.
+
+    Parameters
+    ----------
+    delay : float
+        Seconds to wait before the first retry. Default 1.
+    multiplier : float
+        Factor by which the wait grows after each retry, at least 1. Default 1.
+    max_delay : float
+        Maximum seconds to wait between retries. Default 30.
+    jitter : float
+        Maximum fraction of each wait which is randomly skipped, between 0 and 1.
+        Default 0.
+    deadline : float, optional
+        Seconds after which to stop retrying. The last error is raised rather than
+        waiting past the deadline, for a retry or for the rate limit (see
+        ``set_rate_limiter``). No limit if not provided.
+    http_retries : int
+        Number of retries after HTTP errors. Set to -1 for unlimited. Default 0.
+
+    """
+
+    delay: float = 1
+    multiplier: float = 1
+    max_delay: float = 30
+    jitter: float = 0
+    deadline: typing.Optional[float] = None
+    http_retries: int = 0
+
+    def __post_init__(self):
+        if min(self.delay, self.max_delay, self.deadline or 0) < 0:
+            raise ValueError("Delays and deadline must not be negative.")
+        if self.multiplier < 1:
+            raise ValueError("Multiplier must be at least 1.")
+        if not 0 <= self.jitter <= 1:
+            raise ValueError("Jitter must be between 0 and 1.")
+        if self.http_retries < -1:
+            raise ValueError("HTTP retries must be -1 (unlimited) or more.")
+
+    def wait(self, retry: int) -> float:
+        """Return the seconds to wait before a retry, counting retries from zero."""
+        try:
+            wait = min(self.max_delay, self.delay * self.multiplier**retry)
+        except OverflowError:
+            wait = self.max_delay
+        return wait * (1 - self.jitter * random.random())
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def _is_transient(error: requests.RequestException) -> bool:
+    """Return whether a HTTP error might not happen again, and is worth retrying."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+
+    response = getattr(error, "response", None)
+    return response is not None and (response.status_code == 429 or response.status_code >= 500)
+
+
+class _Retries:
+    """Count the retries made by ``request_robust``, and decide when to give up."""
+
+    def __init__(self, retries: int, policy: typing.Optional[RetryPolicy]):
+        self.policy = policy or DEFAULT_RETRY_POLICY
+        self.limits = {"feed": retries, "http": self.policy.http_retries}
+        self.counts = {"feed": 0, "http": 0}
+        self.deadline = None
+        if self.policy.deadline is not None:
+            self.deadline = time.monotonic() + self.policy.deadline
+
+    def wait(self, error: Exception) -> typing.Optional[float]:
+        """Return the seconds to wait before retrying after an error, or None to give up."""
+        if isinstance(error, requests.RequestException):
+            if not _is_transient(error):
+                return None
+            kind = "http"
+        else:
+            kind = "feed"
+
+        if self.limits[kind] != -1 and self.counts[kind] >= self.limits[kind]:
+            return None
+
+        wait = self.policy.wait(sum(self.counts.values()))
+        if self.deadline is not None and time.monotonic() + wait > self.deadline:
+            return None
+
+        self.counts[kind] += 1
+        return wait
+
+
+# errors after which request_robust may retry
+_RETRY_ERRORS = (InvalidFeedError, google.protobuf.message.DecodeError, requests.RequestException)
+
+
+@dataclasses.dataclass
+class _CachedFeed:
+    """The last response from a feed url, and the results of loading it."""
+
+    content: bytes
+    etag: typing.Optional[str]
+    last_modified: typing.Optional[str]
+    timestamp: typing.Optional[int]
+    loaded: dict = dataclasses.field(default_factory=dict)
+
+    @functools.cached_property
+    def digest(self) -> bytes:
+        """Return a hash of the content."""
+        return _digest(self.content)
+
+    def matches(self, content: bytes, timestamp: typing.Optional[int]) -> bool:
+        """Return whether new content is the same as the cached content.
+
+        The header timestamps are compared first, so that content is only hashed if the
+        feed has not obviously changed.
+        """
+        return timestamp == self.timestamp and _digest(content) == self.digest
+
+
+def _digest(content: bytes) -> bytes:
+    """Return a hash of feed content."""
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def _read_varint(view: memoryview, pos: int) -> tuple[int, int]:
+    """Read a protobuf varint from a position, returning the value and the next position."""
+    result = shift = 0
+    while True:
+        if pos >= len(view):
+            raise google.protobuf.message.DecodeError("Truncated varint.")
+        byte = view[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(data) -> typing.Iterator[tuple[int, int, typing.Union[int, memoryview]]]:
+    """Iterate over the top-level fields of serialized protobuf data.
+
+    Yields ``(field_number, wire_type, value)`` tuples. Length-delimited values (strings
+    and nested messages) are memoryviews into the data, so nothing is copied.
+    """
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        key, pos = _read_varint(view, pos)
+        number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, pos = _read_varint(view, pos)
+        elif wire_type in (1, 2, 5):
+            if wire_type == _WIRE_LENGTH_DELIMITED:
+                length, pos = _read_varint(view, pos)
+            else:
+                length = 8 if wire_type == 1 else 4
+            value = view[pos : pos + length]
+            pos += length
+        else:
+            raise google.protobuf.message.DecodeError(f"Unsupported wire type: {wire_type}.")
+
+        if pos > len(view):
+            raise google.protobuf.message.DecodeError("Truncated message.")
+
+        yield number, wire_type, value
+
+
+def _iter_messages(data, number: int) -> typing.Iterator[memoryview]:
+    """Iterate over the serialized messages of a field in serialized protobuf data."""
+    for field_number, wire_type, value in _iter_fields(data):
+        if field_number != number:
+            continue
+        if wire_type != _WIRE_LENGTH_DELIMITED:
+            raise google.protobuf.message.DecodeError(f"Field {number} is not a message.")
+        yield value
+
+
+def _entity_route_id(entity_data) -> typing.Optional[str]:
+    """Return the route ID of a serialized FeedEntity, without parsing the rest of it.
+
+    As with the parsed models, the trip update is used if present, then the vehicle.
+    Entities with neither (e.g., alerts) have no route.
+    """
+    containers = {}
+    for number in (_ENTITY_TRIP_UPDATE, _ENTITY_VEHICLE):
+        for value in _iter_messages(entity_data, number):
+            containers[number] = value
+
+    container = containers.get(_ENTITY_TRIP_UPDATE, containers.get(_ENTITY_VEHICLE))
+    if container is None:
+        return None
+
+    route_id = ""  # the protobuf default, if unset
+    for trip in _iter_messages(container, _TRIP):
+        for value in _iter_messages(trip, _TRIP_ROUTE_ID):
+            route_id = bytes(value).decode()
+    return route_id
+
+
+def _header_timestamp(protobuf_bytes: bytes) -> typing.Optional[int]:
+    """Return the header timestamp of serialized feed data, without parsing the rest of it.
+
+    None is returned if the data have no header timestamp or cannot be scanned.
+    """
+    try:
+        for header in _iter_messages(protobuf_bytes, _FEED_HEADER):
+            for number, wire_type, value in _iter_fields(header):
+                if number == _HEADER_TIMESTAMP and wire_type == _WIRE_VARINT:
+                    return value
+            return None
+    except google.protobuf.message.DecodeError:
+        return None
+    return None
+
+
+def iter_entities(
+    protobuf_bytes: bytes, routes: typing.Optional[typing.Collection[str]] = None
+) -> typing.Iterator[gtfs_realtime_pb2.FeedEntity]:
+    """Iterate over the entities in protobuf data, optionally only those for some routes.
+
+    The data are scanned one entity at a time, and entities for other routes are skipped
+    without being parsed. This keeps memory use proportional to the matching entities,
+    which matters for the bus feed (every NYC bus trip is in one message).
+
+    Parameters
+    ----------
+    protobuf_bytes : bytes
+        Protobuf data, as returned from the raw request.
+    routes : collection of str, optional
+        Route IDs to include. All entities are included if not provided.
+
+    Yields
+    ------
+    gtfs_realtime_pb2.FeedEntity
+        Parsed entity messages.
+
+    """
+    for value in _iter_messages(protobuf_bytes, _FEED_ENTITY):
+        if routes is None or _entity_route_id(value) in routes:
+            yield gtfs_realtime_pb2.FeedEntity.FromString(value)
+
+
+def parse_protobuf(
+    protobuf_bytes: bytes,
+    routes: typing.Optional[typing.Collection[str]] = None,
+    policy: typing.Optional[ValidationPolicy] = None,
+) -> gtfs_realtime_pb2.FeedMessage:
+    """Parse a protobuf bytes object into a GTFS realtime feed message.
+
+    Parameters
+    ----------
+    protobuf_bytes : bytes
+        Protobuf data, as returned from the raw request.
+    routes : collection of str, optional
+        Route IDs to include. If provided, only the entities for these routes are parsed
+        (see ``iter_entities``). All entities are included if not provided.
+    policy : ValidationPolicy, optional
+        Policy whose entity count check the feed must pass. Entities for all routes are
+        counted. Default ``DEFAULT_POLICY``, which requires at least one entity.
+
+    Returns
+    -------
+    gtfs_realtime_pb2.FeedMessage
+        The parsed feed message.
+
+    """
+    policy = policy or DEFAULT_POLICY
+    feed = gtfs_realtime_pb2.FeedMessage()
+    if routes is None:
+        feed.ParseFromString(protobuf_bytes)
+        policy.check_entities(len(feed.entity))
+        return feed
+
+    # an empty feed is an error, but a feed without the requested routes is not.
+    entity_count = 0
+    for number, wire_type, value in _iter_fields(protobuf_bytes):
+        if number not in (_FEED_HEADER, _FEED_ENTITY):
+            continue
+        if wire_type != _WIRE_LENGTH_DELIMITED:
+            raise google.protobuf.message.DecodeError(f"Field {number} is not a message.")
+
+        if number == _FEED_HEADER:
+            feed.header.MergeFromString(value)
+        else:
+            entity_count += 1
+            if _entity_route_id(value) in routes:
+                feed.entity.add().MergeFromString(value)
+
+    policy.check_entities(entity_count)
+    return feed
+
+
+def load_protobuf(protobuf_bytes: bytes, policy: typing.Optional[ValidationPolicy] = None) -> dict:
     """Process a protobuf bytes object into native python.
 
     Parameters
     ----------
     protobuf_bytes : bytes
         Protobuf data, as returned from the raw request.
+    policy : ValidationPolicy, optional
+        Policy whose entity count check the feed must pass. See ``parse_protobuf``.
 
     Returns
     -------
     Processed feed data.
 
     """
-    feed = gtfs_realtime_pb2.FeedMessage()
-    feed.ParseFromString(protobuf_bytes)
+    feed = parse_protobuf(protobuf_bytes, policy=policy)
     feed_dict = protobuf_to_dict.protobuf_to_dict(feed)
     if not feed_dict or "entity" not in feed_dict:
         raise EmptyFeedError
@@ -37,17 +453,452 @@ def load_protobuf(protobuf_bytes: bytes) -> dict:
     return feed_dict
 
 
-def request(route_or_url: str) -> bytes:
+def check_protobuf(
+    protobuf_bytes: bytes, policy: typing.Optional[ValidationPolicy] = None
+) -> bytes:
+    """Check that a protobuf bytes object parses into a valid feed, and return it as is.
+
+    This is cheaper than ``load_protobuf``, as the feed is not converted to python.
+
+    Parameters
+    ----------
+    protobuf_bytes : bytes
+        Protobuf data, as returned from the raw request.
+    policy : ValidationPolicy, optional
+        Policy whose entity count check the feed must pass. See ``parse_protobuf``.
+
+    Returns
+    -------
+    bytes
+        The protobuf data.
+
+    """
+    parse_protobuf(protobuf_bytes, policy=policy)
+    return protobuf_bytes
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE * CACHE_LOADERS)
+def _default_loader(
+    return_dict: bool, policy: typing.Optional[ValidationPolicy]
+) -> typing.Callable[[bytes], typing.Any]:
+    """Return the loader used by ``request_robust`` if none is given.
+
+    The same function is returned for the same arguments, so that its results can be
+    reused while a feed is unchanged. Module functions are looked up when called.
+    """
+    if return_dict:
+        return lambda protobuf_bytes: load_protobuf(protobuf_bytes, policy=policy)
+    return lambda protobuf_bytes: check_protobuf(protobuf_bytes, policy=policy)
+
+
+class _TimeoutAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter applying a timeout to requests which do not set their own."""
+
+    def __init__(self, timeout: typing.Union[float, tuple[float, float]], **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=self.timeout if timeout is None else timeout, **kwargs)
+
+
+def make_session(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    timeout: typing.Union[float, tuple[float, float]] = DEFAULT_TIMEOUT,
+) -> requests.Session:
+    """Create a HTTP session for requesting feed data.
+
+    Connections are kept alive and pooled, so repeated requests to the MTA (such as
+    retries, or polling a feed) reuse an open connection rather than reconnecting.
+    Responses are requested with gzip compression.
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of connections kept open per host. Default 10.
+    timeout : float or tuple of float
+        Seconds to wait for the server to accept a connection and to send data, as in
+        ``requests.get``. A single number sets both. Default ``DEFAULT_TIMEOUT``.
+
+    Returns
+    -------
+    requests.Session
+        The configured session.
+
+    """
+    session = requests.Session()
+    adapter = _TimeoutAdapter(timeout, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the session shared by feed requests, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def set_session(session: typing.Optional[requests.Session]) -> None:
+    """Replace the session shared by feed requests.
+
+    Parameters
+    ----------
+    session : requests.Session or None
+        The session to share, such as one from ``make_session`` with a different pool
+        size. If None, a default session is created on the next request.
+
+    """
+    global _session
+    with _session_lock:
+        _session = session
+
+
+class LatencyHistogram:
+    """Counts of request latencies, in buckets growing by a factor of sqrt(2).
+
+    A histogram is kept for each feed url (see ``latency_histogram``), and its quantiles
+    set the wait before hedging a request (see ``HedgePolicy``).
+
+    Parameters
+    ----------
+    buckets : sequence of float
+        Upper bounds of the buckets in seconds, in increasing order. Latencies above the
+        last bound are counted in an extra bucket. Default ``DEFAULT_LATENCY_BUCKETS``.
+
+    """
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        """Return the number of latencies recorded."""
+        return sum(self.counts)
+
+    def record(self, seconds: float) -> None:
+        """Record a latency."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+
+    def quantile(self, q: float) -> typing.Optional[float]:
+        """Return the upper bound of the bucket holding a quantile of the latencies.
+
+        None is returned if no latencies are recorded, and infinity if the quantile is
+        above the last bucket.
+        """
+        with self._lock:
+            counts = list(self.counts)
+
+        target, cumulative = q * sum(counts), 0
+        if not target:
+            return None
+
+        for index, count in enumerate(counts[:-1]):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[index]
+        return math.inf
+
+
+def latency_histogram(route_or_url: str) -> LatencyHistogram:
+    """Return the histogram of latencies of requests to a feed, creating it if needed."""
+    url = metadata.resolve_url(route_or_url)
+    with _hedge_lock:
+        return _latencies.setdefault(url, LatencyHistogram())
+
+
+@dataclasses.dataclass(frozen=True)
+class HedgePolicy:
+    """When to send a second, hedged request for a feed that is slow to respond.
+
+    A request which has not completed within a quantile of the recent latencies of its
+    feed is sent again, and whichever response arrives first is used. This trims the
+    latency tail at the cost of a few extra requests.
+
+    Parameters
+    ----------
+    quantile : float
+        Quantile of the feed latency after which to hedge. Default 0.95.
+    delay : float
+        Seconds after which to hedge until ``min_samples`` latencies are recorded for
+        the feed. Default 1.
+    min_samples : int
+        Number of latencies recorded for a feed before using its quantile. Default 20.
+
+    """
+
+    quantile: float = 0.95
+    delay: float = 1
+    min_samples: int = 20
+
+    def hedge_after(self, histogram: LatencyHistogram) -> typing.Optional[float]:
+        """Return the seconds after which to hedge a request, given the feed latencies.
+
+        None is returned if the quantile is above the last histogram bucket, in which
+        case the request is not hedged.
+        """
+        if histogram.total < max(self.min_samples, 1):
+            return self.delay
+
+        after = histogram.quantile(self.quantile)
+        return None if after is None or math.isinf(after) else after
+
+
+def set_hedge_policy(policy: typing.Optional[HedgePolicy]) -> None:
+    """Set the policy for hedging feed requests, or None (the default) to not hedge."""
+    global _hedge_policy
+    _hedge_policy = policy
+
+
+def _timed_get(session: requests.Session, url: str, headers: dict) -> requests.Response:
+    """Send a HTTP GET request, recording its latency in the histogram for the url."""
+    start = time.perf_counter()
+    res = session.get(url, headers=headers)
+    latency_histogram(url).record(time.perf_counter() - start)
+    return res
+
+
+def _hedged_get(
+    session: requests.Session, url: str, headers: dict, policy: HedgePolicy
+) -> requests.Response:
+    """Send a HTTP GET request, and send it again if the first is slow to respond.
+
+    The first response to arrive is returned, unless it is an error and the other
+    request is still running. The slower request is left to finish in the background.
+    """
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=2 * DEFAULT_POOL_SIZE, thread_name_prefix="underground-hedge"
+            )
+        executor = _hedge_executor
+
+    hedge_after = policy.hedge_after(latency_histogram(url))
+    if hedge_after is None:
+        return _timed_get(session, url, headers)
+
+    first = executor.submit(_timed_get, session, url, headers)
+    try:
+        return first.result(timeout=hedge_after)
+    except concurrent.futures.TimeoutError:
+        # the hedged request counts against the rate limit, and is not sent without a token
+        if _rate_limiter is not None and _rate_limiter.try_acquire(url):
+            return first.result()
+        pending = {first, executor.submit(_timed_get, session, url, headers)}
+
+    while True:
+        done, pending = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        # prefer a response over an error if both requests finished
+        done = sorted(done, key=lambda x: x.exception() is not None)
+        if done[0].exception() is None or not pending:
+            return done[0].result()
+
+
+def clear_cache() -> None:
+    """Forget the feed data kept from previous requests."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def set_result_cache(enabled: bool) -> None:
+    """Keep the results of loading feeds, to return again while a feed is unchanged.
+
+    This is off by default. When on, ``request_robust`` returns the same object to every
+    caller while a feed serves the same data, so returned objects must not be mutated.
+    Dicts are never kept, as they are too easily mutated. Results are kept for up to
+    ``CACHE_LOADERS`` loaders for each of the ``CACHE_SIZE`` most recently requested
+    urls, which for the bus feed can take a lot of memory.
+
+    Parameters
+    ----------
+    enabled : bool
+        Option to keep loaded results.
+
+    """
+    global _cache_results
+    with _cache_lock:
+        _cache_results = enabled
+        if not enabled:
+            for cached in _cache.values():
+                cached.loaded.clear()
+
+
+def _take_token(
+    url: str, cached: typing.Optional[_CachedFeed], deadline: typing.Optional[float]
+) -> bool:
+    """Take a token from the rate limiter for a url, if one is set (see ``set_rate_limiter``).
+
+    If the url has no requests left for now, False is returned so that the last response
+    is served if there is one, or else this waits for a token until the deadline (in
+    ``time.monotonic`` seconds), and raises ``RateLimitedError`` if there is none by then.
+    """
+    if _rate_limiter is None or not _rate_limiter.try_acquire(url):
+        return True
+    if cached is not None:
+        return False
+
+    timeout = None if deadline is None else max(0, deadline - time.monotonic())
+    if not _rate_limiter.acquire(url, timeout=timeout):
+        raise RateLimitedError(f"No request allowed to {url} before the deadline.")
+    return True
+
+
+def _download(
+    url: str, session: typing.Optional[requests.Session], cached: typing.Optional[_CachedFeed]
+) -> tuple[bytes, tuple[typing.Optional[str], typing.Optional[str]]]:
+    """Send a conditional HTTP GET request for a feed url.
+
+    If the last response from the url had an ETag or Last-Modified header, they are sent
+    back to the server, which replies with no content if the feed has not changed since.
+
+    Returns
+    -------
+    tuple
+        The feed contents, and the (ETag, Last-Modified) headers of the response.
+
+    """
+    headers = {}
+    if cached is not None:
+        if cached.etag is not None:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified is not None:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    session = session or get_session()
+    if _hedge_policy is None:
+        res = _timed_get(session, url, headers)
+    else:
+        res = _hedged_get(session, url, headers, _hedge_policy)
+    res.raise_for_status()
+
+    if res.status_code == 304 and cached is not None:
+        return cached.content, (cached.etag, cached.last_modified)
+    return res.content, (res.headers.get("ETag"), res.headers.get("Last-Modified"))
+
+
+def _request_url(
+    url: str, session: typing.Optional[requests.Session], deadline: typing.Optional[float] = None
+) -> tuple[bytes, typing.Optional[_CachedFeed]]:
+    """Request the contents of a feed url, comparing them to the last response.
+
+    Requests are conditional (see ``_download``), and are served from the disk cache if
+    one is set (see ``set_disk_cache``). If the rate limit allows no request for now, the
+    last response is served, or else the request waits until the deadline (see
+    ``_take_token``).
+
+    Returns
+    -------
+    tuple
+        The feed contents, and the cache entry holding them if the feed has not changed
+        since the last request (or None if the contents are new).
+
+    """
+    with _cache_lock:
+        cached = _cache.get(url)
+
+    # data shared by another process are served without taking a token
+    content = None if _disk_cache is None else _disk_cache.get(url)
+    validators = None
+    if content is None and not _take_token(url, cached, deadline):
+        # serve the last response rather than wait for a request to be allowed
+        content = cached.content
+    elif content is None and _disk_cache is None:
+        content, validators = _download(url, session, cached)
+    elif content is None:
+        # the token is taken first, so that waiting for it does not block other processes.
+        # then hold the lock so that other processes wait for this download, and share it
+        with _disk_cache.lock(url):
+            content = _disk_cache.get(url)
+            if content is None:
+                content, validators = _download(url, session, cached)
+                _disk_cache.put(url, content)
+
+    if cached is not None and content is cached.content:
+        timestamp, unchanged = cached.timestamp, True
+    else:
+        timestamp = _header_timestamp(content)
+        unchanged = cached is not None and cached.matches(content, timestamp)
+
+    with _cache_lock:
+        # the entry may have been replaced or dropped by another request in the meantime
+        if unchanged and _cache.get(url) is cached:
+            if validators is not None:
+                cached.etag, cached.last_modified = validators
+            _cache.move_to_end(url)
+            return cached.content, cached
+
+        _cache[url] = _CachedFeed(content, *(validators or (None, None)), timestamp)
+        _cache.move_to_end(url)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return content, None
+
+
+def set_disk_cache(cache: typing.Optional[disk_cache.DiskCache]) -> None:
+    """Set a cache on disk for feed requests, or None (the default) to not use one.
+
+    Feed data younger than the cache ttl are read from disk rather than requested, so
+    processes (such as repeated CLI calls) share recent data.
+
+    Parameters
+    ----------
+    cache : disk_cache.DiskCache or None
+        The cache to use.
+
+    """
+    global _disk_cache
+    _disk_cache = cache
+
+
+def set_rate_limiter(limiter: typing.Optional[rate_limit.RateLimiter]) -> None:
+    """Set a limit on the rate of requests to each feed, or None (the default) for none.
+
+    When a feed has no requests left for now, the data of its last response are served
+    if there are any, or else the request waits until it is allowed, rather than being
+    sent and refused by the server. ``request_robust`` raises ``RateLimitedError`` if the
+    wait would pass the deadline of its retry policy. Hedged requests (see
+    ``HedgePolicy``) take a token too, and are not sent if there is none.
+
+    Parameters
+    ----------
+    limiter : rate_limit.RateLimiter or None
+        The rate limiter to use.
+
+    """
+    global _rate_limiter
+    _rate_limiter = limiter
+
+
+def request(route_or_url: str, session: typing.Optional[requests.Session] = None) -> bytes:
     """Send a HTTP GET request to the MTA for realtime feed data.
 
     Occassionally a feed is requested as the MTA is writing updated data to the file,
     and the feed's contents are not complete. This function does _not_ validate the
     contents of the data, but only returns the request contents as served by the MTA.
 
+    Requests are conditional: if the MTA reports that a feed has not changed since it
+    was last requested, the contents of the last response are returned. If a disk cache
+    is set (see ``set_disk_cache``), recent data are read from disk instead.
+
     Parameters
     ----------
     route_or_url : str
         Route ID or feed url (per ``https://api.mta.info/#/subwayRealTimeFeeds``).
+    session : requests.Session, optional
+        Session used to make the request. The shared session (see ``get_session``) is
+        used if not provided.
 
     Returns
     -------
@@ -55,58 +906,284 @@ def request(route_or_url: str) -> bytes:
         Protobuf data.
 
     """
-    # check feed
-    url = metadata.resolve_url(route_or_url)
+    return _request_url(metadata.resolve_url(route_or_url), session)[0]
+
+
+class _SingleFlight:
+    """Share the result of a call among the threads making it at the same time.
+
+    The first thread to make a call with a key runs it. Threads calling with the same
+    key while it runs wait for it, and get the same result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[typing.Hashable, concurrent.futures.Future] = {}
+
+    def do(self, key: typing.Hashable, func: typing.Callable, *args) -> typing.Any:
+        """Call a function, or wait for the running call with the same key."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                running = True
+            else:
+                running, future = False, concurrent.futures.Future()
+                self._calls[key] = future
+
+        if running:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+_in_flight = _SingleFlight()
+
+# tasks requesting feeds from coroutines, per event loop
+_async_in_flight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = (
+    weakref.WeakKeyDictionary()
+)
 
-    # make the request
-    res = requests.get(url)
-    res.raise_for_status()
 
-    return res.content
+def _flight_key(
+    route_or_url: str,
+    loader: typing.Callable[[bytes], typing.Any],
+    session: typing.Optional[requests.Session],
+    policy: typing.Optional[ValidationPolicy],
+) -> tuple:
+    """Return the key by which concurrent feed requests are shared.
+
+    Requests with different sessions are not shared, as the sessions may differ in
+    authentication, proxies or timeouts. Sessions are compared by identity.
+    """
+    session_id = None if session is None else id(session)
+    return metadata.resolve_url(route_or_url), loader, session_id, policy
+
+
+def _request_and_load(
+    route_or_url: str,
+    loader: typing.Callable[[bytes], typing.Any],
+    session: typing.Optional[requests.Session],
+    policy: typing.Optional[ValidationPolicy] = None,
+    deadline: typing.Optional[float] = None,
+) -> tuple[bytes, typing.Any]:
+    """Request feed data and process it with a loader, returning both.
+
+    Concurrent calls for the same url, loader, session and policy share one request and
+    load, and all return the same result. The deadline of the first call applies to the
+    wait for the rate limit (see ``_take_token``).
+    """
+    key = _flight_key(route_or_url, loader, session, policy)
+    return _in_flight.do(key, _load_url, key[0], loader, session, policy, deadline)
+
+
+async def _arequest_and_load(
+    route_or_url: str,
+    loader: typing.Callable[[bytes], typing.Any],
+    session: typing.Optional[requests.Session],
+    policy: typing.Optional[ValidationPolicy] = None,
+    deadline: typing.Optional[float] = None,
+) -> tuple[bytes, typing.Any]:
+    """Run ``_request_and_load`` in a worker thread, sharing it among coroutines.
+
+    Coroutines awaiting the same call share one worker thread, rather than each holding
+    a thread while waiting for the first. Cancelling one does not cancel the others.
+    """
+    key = _flight_key(route_or_url, loader, session, policy)
+    tasks = _async_in_flight.setdefault(asyncio.get_running_loop(), {})
+    task = tasks.get(key)
+    if task is None:
+        task = asyncio.ensure_future(
+            asyncio.to_thread(_request_and_load, route_or_url, loader, session, policy, deadline)
+        )
+        tasks[key] = task
+
+        def forget(done: asyncio.Future):
+            if tasks.get(key) is done:
+                del tasks[key]
+
+        task.add_done_callback(forget)
+
+    return await asyncio.shield(task)
+
+
+def _load_url(
+    url: str,
+    loader: typing.Callable[[bytes], typing.Any],
+    session: typing.Optional[requests.Session],
+    policy: typing.Optional[ValidationPolicy],
+    deadline: typing.Optional[float] = None,
+) -> tuple[bytes, typing.Any]:
+    """Request feed data from a url and process it with a loader, returning both.
+
+    If result caching is on (see ``set_result_cache``) and the feed has not changed
+    since it was last loaded by the same loader, the result from then is returned without
+    processing the data again. Results are dropped when a url serves new data.
+    """
+    protobuf_data, cached = _request_url(url, session, deadline)
+
+    # unchanged data can still become stale, so the age is checked every time
+    if policy is not None:
+        timestamp = _header_timestamp(protobuf_data) if cached is None else cached.timestamp
+        policy.check_timestamp(timestamp)
+
+    if cached is not None and loader in cached.loaded:
+        return protobuf_data, cached.loaded[loader]
+
+    try:
+        loaded = loader(protobuf_data)
+    except (InvalidFeedError, google.protobuf.message.DecodeError):
+        # don't ask the server to confirm incomplete data on the next attempt
+        with _cache_lock:
+            if url in _cache and _cache[url].content is protobuf_data:
+                del _cache[url]
+        if _disk_cache is not None:
+            _disk_cache.discard(url)
+        raise
+
+    if not _cache_results or isinstance(loaded, dict):
+        return protobuf_data, loaded
+
+    with _cache_lock:
+        if url in _cache and _cache[url].content is protobuf_data:
+            results = _cache[url].loaded
+            results[loader] = loaded
+            if len(results) > CACHE_LOADERS:
+                del results[next(iter(results))]
+
+    return protobuf_data, loaded
 
 
 def request_robust(
-    route_or_url: str, retries: int = 100, return_dict: bool = False
-) -> typing.Union[bytes, dict]:
+    route_or_url: str,
+    retries: int = 100,
+    return_dict: bool = False,
+    loader: typing.Optional[typing.Callable[[bytes], typing.Any]] = None,
+    session: typing.Optional[requests.Session] = None,
+    policy: typing.Optional[ValidationPolicy] = None,
+    retry_policy: typing.Optional[RetryPolicy] = None,
+) -> typing.Any:
     """Request feed data with validations and retries.
 
     Occassionally a feed is requested as the MTA is writing updated data to the file,
     and the feed's contents are not complete. This function validates data completeness
-    and retries if the data are not complete. Since we are processing the protobuf
-    anyway, there is an option to return the processed data as familiar python objects.
+    and retries if the data are not complete. Validation only parses the protobuf, and
+    the data are only processed into familiar python objects if ``return_dict`` is set.
+
+    If result caching is on (see ``set_result_cache``) and a feed has not changed since
+    it was last processed by the same loader, either as reported by the MTA or by
+    comparing the data, the result from then is returned without processing the data
+    again.
+
+    Concurrent calls for the same feed with the same loader, session and policy (for
+    instance, from several threads) share one request and load, and get the same result. Returned
+    objects may therefore be shared with other callers, and must not be mutated.
 
     Parameters
     ----------
     route_or_url : str
         Route ID or feed url (per ``https://api.mta.info/#/subwayRealTimeFeeds``).
     retries : int
-        Number of retry attempts, with 1 second timeout between attempts.
-        Set to -1 for unlimited. Default 100.
+        Number of retry attempts after incomplete data, with 1 second timeout between
+        attempts by default. Set to -1 for unlimited. Default 100.
     return_dict : bool
         Option to return the process data as a dict rather than as raw protobuf data.
         This is equivalent to running ``load_protobuf(request_robust(...))``.
+    loader : callable, optional
+        Function used to process (and thereby validate) the protobuf data in place of
+        ``check_protobuf`` or ``load_protobuf``, such as ``SubwayFeed.from_protobuf``.
+        If provided, its result is returned rather than the bytes or dict.
+    session : requests.Session, optional
+        Session used to make requests. The shared session (see ``get_session``) is
+        used if not provided.
+    policy : ValidationPolicy, optional
+        Checks the data must pass, retrying if they do not. The entity count is checked
+        while loading the data, so a custom loader must check it (for instance, by
+        passing the policy to ``SubwayFeed.from_protobuf``). The header age is always
+        checked. Default ``DEFAULT_POLICY``.
+    retry_policy : RetryPolicy, optional
+        How long to wait between retries, whether to retry HTTP errors, and when to
+        stop retrying. Default ``DEFAULT_RETRY_POLICY``.
 
     Returns
     -------
     bytes or dict
         The current GTFS data as bytes or a dictionary, depending on the
-        ``return_dict`` flag.
+        ``return_dict`` flag. If a loader is provided, its result is returned instead.
 
     """
-    # get protobuf bytes
-    protobuf_data = request(route_or_url=route_or_url)
-    for attempt in range(retries + 1):
+    attempts = _Retries(retries, retry_policy)
+    while True:
         try:
-            feed_dict = load_protobuf(protobuf_data)
+            protobuf_data, loaded = _request_and_load(
+                route_or_url,
+                loader or _default_loader(return_dict, policy),
+                session,
+                policy,
+                attempts.deadline,
+            )
             break  # break if success
 
-        except (EmptyFeedError, google.protobuf.message.DecodeError):
+        except _RETRY_ERRORS as error:
             # raise if we're out of retries
-            if attempt == retries:
+            wait = attempts.wait(error)
+            if wait is None:
                 raise
 
-            # wait 1 second and then make new protobuf data
-            time.sleep(1)  # be cool to the MTA
-            protobuf_data = request(route_or_url=route_or_url)
+            time.sleep(wait)  # be cool to the MTA
+
+    if loader is not None or return_dict:
+        return loaded
+
+    return protobuf_data
+
+
+async def arequest_robust(
+    route_or_url: str,
+    retries: int = 100,
+    return_dict: bool = False,
+    loader: typing.Optional[typing.Callable[[bytes], typing.Any]] = None,
+    session: typing.Optional[requests.Session] = None,
+    policy: typing.Optional[ValidationPolicy] = None,
+    retry_policy: typing.Optional[RetryPolicy] = None,
+) -> typing.Any:
+    """Request feed data with validations and retries, without blocking the event loop.
+
+    This is the asyncio version of ``request_robust``, and takes the same arguments. The
+    request and loader run in a worker thread and retries wait with ``asyncio.sleep``, so
+    many feeds can be requested concurrently with ``asyncio.gather``. Concurrent requests
+    for the same feed, from coroutines or threads, share one request.
+    """
+    attempts = _Retries(retries, retry_policy)
+    while True:
+        try:
+            protobuf_data, loaded = await _arequest_and_load(
+                route_or_url,
+                loader or _default_loader(return_dict, policy),
+                session,
+                policy,
+                attempts.deadline,
+            )
+            break  # break if success
+
+        except _RETRY_ERRORS as error:
+            # raise if we're out of retries
+            wait = attempts.wait(error)
+            if wait is None:
+                raise
+
+            await asyncio.sleep(wait)  # be cool to the MTA
+
+    if loader is not None or return_dict:
+        return loaded
 
-    return feed_dict if return_dict else protobuf_data
+    return protobuf_data
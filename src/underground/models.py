@@ -1,14 +1,91 @@
 """Pydantic data models for MTA GFTS data."""
 
+import asyncio
+import bisect
 import datetime
+import functools
+import heapq
+import math
 import typing
 import zoneinfo
 
 import pydantic
+import requests
+from google.transit import gtfs_realtime_pb2
 
 from underground import feed, metadata
 
 
+def _set_fields(message, *names: str, trusted: bool = False) -> dict:
+    """Return the named fields that are set on a protobuf message, as a dict.
+
+    This mirrors ``protobuf_to_dict``, which omits unset fields entirely. If trusted, the
+    fields are assumed to be set and are read without checking for their presence.
+    """
+    if trusted:
+        return {name: getattr(message, name) for name in names}
+    return {name: getattr(message, name) for name in names if message.HasField(name)}
+
+
+def _group_stop_times(stops_flat: typing.Iterable[tuple[str, str, typing.Any]]) -> dict:
+    """Group (route, stop, time) tuples into a dict like ``{route: {stop: [t1, t2]}}``."""
+    stops_grouped = dict()
+
+    for route_id, stop_id, departure in stops_flat:
+        if route_id not in stops_grouped:
+            stops_grouped[route_id] = dict()
+
+        if stop_id not in stops_grouped[route_id]:
+            stops_grouped[route_id][stop_id] = []
+
+        stops_grouped[route_id][stop_id].append(departure)
+
+    return stops_grouped
+
+
+def _sort_stop_times(stops_grouped: dict, limit: typing.Optional[int] = None) -> dict:
+    """Sort the times of each stop in a grouped dict, keeping the first ``limit`` if given.
+
+    The first times are selected with a bounded heap, rather than sorting all of them.
+    """
+    for route_stops in stops_grouped.values():
+        for stop_id, departures in route_stops.items():
+            if limit is None:
+                departures.sort()
+            else:
+                route_stops[stop_id] = heapq.nsmallest(limit, departures)
+
+    return stops_grouped
+
+
+@functools.lru_cache(maxsize=feed.CACHE_SIZE * feed.CACHE_LOADERS)
+def _loader(
+    cls: type,
+    trusted: bool,
+    routes: typing.Optional[frozenset[str]] = None,
+    policy: typing.Optional[feed.ValidationPolicy] = None,
+) -> typing.Callable[[bytes], typing.Any]:
+    """Return the function loading protobuf bytes into a feed class.
+
+    The same function is returned for the same arguments, so that feed requests can
+    reuse the loaded feed when a feed has not changed. Functions are kept for as many
+    argument combinations as the feed cache can hold results for, so that many route
+    filters do not build up.
+    """
+    kwargs = dict(trusted=trusted, policy=policy)
+    if routes is not None:
+        kwargs["routes"] = routes
+    return functools.partial(cls.from_protobuf, **kwargs)
+
+
+class Departure(typing.NamedTuple):
+    """A departure from a stop, as returned by ``SubwayFeed.departures``."""
+
+    time: datetime.datetime
+    route_id: str
+    trip_id: str
+
+
 class UnixTimestamp(pydantic.BaseModel):
     """A unix timestamp model."""
 
@@ -21,6 +98,15 @@ class UnixTimestamp(pydantic.BaseModel):
             return None
         return self.time.astimezone(zoneinfo.ZoneInfo(metadata.DEFAULT_TIMEZONE))
 
+    @classmethod
+    def from_protobuf(
+        cls, message: gtfs_realtime_pb2.TripUpdate.StopTimeEvent, trusted: bool = False
+    ) -> "UnixTimestamp":
+        """Create an instance from a StopTimeEvent protobuf message."""
+        if trusted:
+            return cls(time=message.time or None)
+        return cls(**_set_fields(message, "time"))
+
 
 class FeedHeader(pydantic.BaseModel):
     """Data model for the feed header."""
@@ -33,6 +119,13 @@ class FeedHeader(pydantic.BaseModel):
         """Return the NYC datetime of the header."""
         return self.timestamp.astimezone(zoneinfo.ZoneInfo(metadata.DEFAULT_TIMEZONE))
 
+    @classmethod
+    def from_protobuf(
+        cls, message: gtfs_realtime_pb2.FeedHeader, trusted: bool = False
+    ) -> "FeedHeader":
+        """Create an instance from a FeedHeader protobuf message."""
+        return cls(**_set_fields(message, "gtfs_realtime_version", "timestamp", trusted=trusted))
+
 
 class Trip(pydantic.BaseModel):
     """Model describing a train trip."""
@@ -55,6 +148,17 @@ class Trip(pydantic.BaseModel):
         """Return a flag indicating that there is a route."""
         return self.route_id != ""
 
+    @classmethod
+    def from_protobuf(
+        cls, message: gtfs_realtime_pb2.TripDescriptor, trusted: bool = False
+    ) -> "Trip":
+        """Create an instance from a TripDescriptor protobuf message."""
+        if not trusted:
+            return cls(**_set_fields(message, "trip_id", "start_time", "start_date", "route_id"))
+
+        fields = _set_fields(message, "trip_id", "start_date", "route_id", trusted=True)
+        return cls(start_time=message.start_time or None, **fields)
+
 
 class StopTimeUpdate(pydantic.BaseModel):
     """Stop times for a trip.
@@ -90,6 +194,18 @@ class StopTimeUpdate(pydantic.BaseModel):
         elif self.arrival is not None and self.arrival.time is not None:
             return self.arrival
 
+    @classmethod
+    def from_protobuf(
+        cls, message: gtfs_realtime_pb2.TripUpdate.StopTimeUpdate, trusted: bool = False
+    ) -> "StopTimeUpdate":
+        """Create an instance from a StopTimeUpdate protobuf message."""
+        fields = _set_fields(message, "stop_id", trusted=trusted)
+        if message.HasField("arrival"):
+            fields["arrival"] = UnixTimestamp.from_protobuf(message.arrival, trusted)
+        if message.HasField("departure"):
+            fields["departure"] = UnixTimestamp.from_protobuf(message.departure, trusted)
+        return cls(**fields)
+
 
 class TripUpdate(pydantic.BaseModel):
     """Info on trips that are underway or scheduled to start within 30 mins.
@@ -106,6 +222,20 @@ class TripUpdate(pydantic.BaseModel):
     trip: Trip
     stop_time_update: typing.Optional[list[StopTimeUpdate]] = None
 
+    @classmethod
+    def from_protobuf(
+        cls, message: gtfs_realtime_pb2.TripUpdate, trusted: bool = False
+    ) -> "TripUpdate":
+        """Create an instance from a TripUpdate protobuf message."""
+        fields = {}
+        if trusted or message.HasField("trip"):
+            fields["trip"] = Trip.from_protobuf(message.trip, trusted)
+        if message.stop_time_update:
+            fields["stop_time_update"] = [
+                StopTimeUpdate.from_protobuf(x, trusted) for x in message.stop_time_update
+            ]
+        return cls(**fields)
+
 
 class Vehicle(pydantic.BaseModel):
     """Data model for the vehicle feed message.
@@ -138,6 +268,16 @@ class Vehicle(pydantic.BaseModel):
     current_stop_sequence: typing.Optional[int] = None
     stop_id: typing.Optional[str] = None
 
+    @classmethod
+    def from_protobuf(
+        cls, message: gtfs_realtime_pb2.VehiclePosition, trusted: bool = False
+    ) -> "Vehicle":
+        """Create an instance from a VehiclePosition protobuf message."""
+        fields = _set_fields(message, "timestamp", "current_stop_sequence", "stop_id")
+        if trusted or message.HasField("trip"):
+            fields["trip"] = Trip.from_protobuf(message.trip, trusted)
+        return cls(**fields)
+
 
 class Entity(pydantic.BaseModel):
     """Model for an element within feed entity.
@@ -150,18 +290,62 @@ class Entity(pydantic.BaseModel):
     vehicle: typing.Optional[Vehicle] = None
     trip_update: typing.Optional[TripUpdate] = None
 
+    @classmethod
+    def from_protobuf(
+        cls, message: gtfs_realtime_pb2.FeedEntity, trusted: bool = False
+    ) -> "Entity":
+        """Create an instance from a FeedEntity protobuf message."""
+        fields = _set_fields(message, "id", trusted=trusted)
+        if message.HasField("vehicle"):
+            fields["vehicle"] = Vehicle.from_protobuf(message.vehicle, trusted)
+        if message.HasField("trip_update"):
+            fields["trip_update"] = TripUpdate.from_protobuf(message.trip_update, trusted)
+        return cls(**fields)
+
 
 class SubwayFeed(pydantic.BaseModel):
     """Model for the main MTA feed data structure.
 
     Includes methods for easy creation and parsing of data.
+
+    Indexes derived from the entities (such as ``vehicles_by_trip``) are built once and
+    cached. They are dropped when the feed is copied with ``model_copy`` or a field is
+    assigned, but not when the entity list is modified in place: treat feeds as
+    immutable, or assign a new entity list.
     """
 
     header: FeedHeader
     entity: list[Entity]
 
+    def _clear_indexes(self):
+        """Drop the cached indexes derived from the feed data."""
+        for cls in type(self).__mro__:
+            for name, value in vars(cls).items():
+                if isinstance(value, functools.cached_property):
+                    self.__dict__.pop(name, None)
+
+    def __setattr__(self, name: str, value: typing.Any):
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            self._clear_indexes()
+
+    def model_copy(self, *, update: typing.Optional[dict] = None, deep: bool = False):
+        """Copy the feed (see ``pydantic.BaseModel.model_copy``), without its indexes."""
+        copied = super().model_copy(update=update, deep=deep)
+        copied._clear_indexes()
+        return copied
+
     @classmethod
-    def get(cls, route_or_url: str, retries: int = 100) -> "SubwayFeed":
+    def get(
+        cls,
+        route_or_url: str,
+        retries: int = 100,
+        trusted: bool = False,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        session: typing.Optional[requests.Session] = None,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+        retry_policy: typing.Optional[feed.RetryPolicy] = None,
+    ) -> "SubwayFeed":
         """Request feed data from the MTA.
 
         Parameters
@@ -171,8 +355,23 @@ class SubwayFeed(pydantic.BaseModel):
             If a route, the URL for that route is looked up. All routes served by that
             URL will be included in the result. Set route_or_url to 'BUS' to obtain bus updates.
         retries : int
-            Number of retry attempts, with 1 second timeout between attempts.
-            Set to -1 for unlimited. Default 100.
+            Number of retry attempts after incomplete data, with 1 second timeout between
+            attempts by default. Set to -1 for unlimited. Default 100.
+        trusted : bool
+            Option to trust that the feed data conform to the GTFS schema, which skips
+            per-field checks while decoding (see ``from_protobuf``). Default False.
+        routes : collection of str, optional
+            Route IDs to include. If provided, entities for other routes are skipped
+            without being parsed. All routes are included if not provided.
+        session : requests.Session, optional
+            Session used to make requests, such as one from ``feed.make_session``. The
+            session shared by all feed requests is used if not provided.
+        policy : feed.ValidationPolicy, optional
+            Checks the feed data must pass, retrying if they do not, such as a minimum
+            number of entities or a maximum age. See ``feed.request_robust``.
+        retry_policy : feed.RetryPolicy, optional
+            How long to wait between retries, whether to retry HTTP errors, and when to
+            stop retrying. Default 1 second between retries, without a deadline.
 
         Returns
         -------
@@ -183,12 +382,303 @@ class SubwayFeed(pydantic.BaseModel):
         if route_or_url == "BUS":
             route_or_url = metadata.BUS_URL
 
-        return cls(
-            **feed.request_robust(route_or_url=route_or_url, retries=retries, return_dict=True)
+        return feed.request_robust(
+            route_or_url=route_or_url,
+            retries=retries,
+            loader=_loader(cls, trusted, None if routes is None else frozenset(routes), policy),
+            session=session,
+            policy=policy,
+            retry_policy=retry_policy,
+        )
+
+    @classmethod
+    async def aget(
+        cls,
+        route_or_url: str,
+        retries: int = 100,
+        trusted: bool = False,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        session: typing.Optional[requests.Session] = None,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+        retry_policy: typing.Optional[feed.RetryPolicy] = None,
+    ) -> "SubwayFeed":
+        """Request feed data from the MTA without blocking the event loop.
+
+        This is the asyncio version of ``get``, and takes the same arguments.
+        """
+        return await feed.arequest_robust(
+            route_or_url=metadata.resolve_url(route_or_url),
+            retries=retries,
+            loader=_loader(cls, trusted, None if routes is None else frozenset(routes), policy),
+            session=session,
+            policy=policy,
+            retry_policy=retry_policy,
         )
 
+    @classmethod
+    async def get_many(
+        cls,
+        routes_or_urls: typing.Iterable[str],
+        retries: int = 100,
+        trusted: bool = False,
+        session: typing.Optional[requests.Session] = None,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+        retry_policy: typing.Optional[feed.RetryPolicy] = None,
+    ) -> dict[str, "SubwayFeed"]:
+        """Request data from several feeds concurrently.
+
+        Routes served by the same URL share one request, so
+        ``get_many(["1", "2", "A"])`` makes two requests rather than three. Each feed is
+        retried on its own, so an incomplete feed does not hold up the others.
+
+        Parameters
+        ----------
+        routes_or_urls : iterable of str
+            Route IDs or feed urls (per ``https://api.mta.info/#/subwayRealTimeFeeds``).
+            Use 'BUS' to obtain bus updates.
+        retries : int
+            Number of retry attempts per feed after incomplete data. Set to -1 for
+            unlimited. Default 100.
+        trusted : bool
+            Option to trust that the feed data conform to the GTFS schema. See ``get``.
+        session : requests.Session, optional
+            Session used to make requests. See ``get``.
+        policy : feed.ValidationPolicy, optional
+            Checks the feed data must pass. See ``get``.
+        retry_policy : feed.RetryPolicy, optional
+            How to retry each feed. See ``get``.
+
+        Returns
+        -------
+        dict
+            Mapping of each route or url to the SubwayFeed holding its data. Routes served
+            by the same URL map to the same SubwayFeed.
+
+        """
+        urls = {route_or_url: metadata.resolve_url(route_or_url) for route_or_url in routes_or_urls}
+        tasks = {
+            url: asyncio.ensure_future(
+                cls.aget(
+                    url,
+                    retries,
+                    trusted=trusted,
+                    session=session,
+                    policy=policy,
+                    retry_policy=retry_policy,
+                )
+            )
+            for url in set(urls.values())
+        }
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            # don't leave the other feeds retrying in the background
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        return {route_or_url: tasks[url].result() for route_or_url, url in urls.items()}
+
+    @classmethod
+    def from_protobuf(
+        cls,
+        protobuf_bytes: bytes,
+        trusted: bool = False,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+    ) -> "SubwayFeed":
+        """Create a feed directly from protobuf bytes.
+
+        This walks the parsed protobuf message once and builds the models directly, rather
+        than converting the message to a dict first. The result is identical to
+        ``SubwayFeed(**load_protobuf(protobuf_bytes))``, but faster on large feeds.
+
+        Parameters
+        ----------
+        protobuf_bytes : bytes
+            Protobuf data, as returned from the raw request.
+        trusted : bool
+            Option to trust that the data conform to the GTFS schema. Fields that the MTA
+            always sets are then read without checking their presence, which is most of
+            the decoding cost. Unset fields take their protobuf defaults rather than
+            raising a validation error. Default False.
+        routes : collection of str, optional
+            Route IDs to include. If provided, entities for other routes are skipped
+            without being parsed (see ``feed.iter_entities``). All routes are included if
+            not provided.
+        policy : feed.ValidationPolicy, optional
+            Policy whose entity count check the feed must pass. See
+            ``feed.parse_protobuf``.
+
+        Returns
+        -------
+        SubwayFeed
+            An instance of the SubwayFeed class with the feed data.
+
+        """
+        message = feed.parse_protobuf(protobuf_bytes, routes=routes, policy=policy)
+        fields = {"entity": [Entity.from_protobuf(x, trusted) for x in message.entity]}
+        if trusted or message.HasField("header"):
+            fields["header"] = FeedHeader.from_protobuf(message.header, trusted)
+        return cls(**fields)
+
+    @functools.cached_property
+    def vehicles_by_trip(self) -> dict[str, Vehicle]:
+        """Index of vehicle positions by trip ID, built once per feed."""
+        return {e.vehicle.trip.trip_id: e.vehicle for e in self.entity if e.vehicle is not None}
+
+    @functools.cached_property
+    def trip_updates_by_route(self) -> dict[str, list[TripUpdate]]:
+        """Index of trip updates by route ID, built once per feed."""
+        index = {}
+        for entity in self.entity:
+            if entity.trip_update is not None:
+                index.setdefault(entity.trip_update.trip.route_id, []).append(entity.trip_update)
+        return index
+
+    @functools.cached_property
+    def trip_updates_by_stop(self) -> dict[str, list[TripUpdate]]:
+        """Index of trip updates by the stop IDs in their stop times, built once per feed."""
+        index = {}
+        for entity in self.entity:
+            update = entity.trip_update
+            if update is None or update.stop_time_update is None:
+                continue
+            for stop_id in dict.fromkeys(x.stop_id for x in update.stop_time_update):
+                index.setdefault(stop_id, []).append(update)
+        return index
+
+    @functools.cached_property
+    def _active_trip_updates(self) -> list[TripUpdate]:
+        """Trip updates with a route and stop times, in feed order."""
+        return [
+            e.trip_update
+            for e in self.entity
+            if e.trip_update is not None
+            and e.trip_update.trip.route_is_assigned
+            and e.trip_update.stop_time_update is not None
+        ]
+
+    @functools.cached_property
+    def _stalled_trips(self) -> dict[int, frozenset[str]]:
+        """Stalled trip IDs computed by ``stalled_trips``, keyed by stalled timeout."""
+        return {}
+
+    def stalled_trips(self, stalled_timeout: int = 90) -> frozenset[str]:
+        """Return the IDs of trips whose train is stalled, computed once per timeout.
+
+        Parameters
+        ----------
+        stalled_timeout : int
+            Number of seconds between the last movement of a train and the API update before
+            considering a train stalled. Default is 90 as recommended by the MTA.
+            Numbers less than 1 disable this check.
+
+        Returns
+        -------
+        frozenset of str
+            Trip IDs of the stalled trains.
+
+        """
+        if stalled_timeout not in self._stalled_trips:
+            # as recommended by the MTA, we use these timestamps to determine if a train is stalled
+            timeout = datetime.timedelta(seconds=stalled_timeout)
+            self._stalled_trips[stalled_timeout] = frozenset(
+                trip_id
+                for trip_id, vehicle in self.vehicles_by_trip.items()
+                if stalled_timeout >= 1
+                and vehicle.timestamp is not None
+                and (self.header.timestamp - vehicle.timestamp) > timeout
+            )
+
+        return self._stalled_trips[stalled_timeout]
+
+    def iter_trip_updates(
+        self,
+        stalled_timeout: int = 90,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        stop_id: typing.Optional[str] = None,
+    ) -> typing.Iterator[tuple[TripUpdate, bool]]:
+        """Iterate over trip updates with a route and stop times, flagging stalled trains.
+
+        Parameters
+        ----------
+        stalled_timeout : int
+            Number of seconds between the last movement of a train and the API update before
+            considering a train stalled. Default is 90 as recommended by the MTA.
+            Numbers less than 1 disable this check.
+        routes : collection of str, optional
+            Option to only include trip updates for these routes, as looked up in
+            ``trip_updates_by_route``. Default all routes.
+        stop_id : str, optional
+            Option to only include trip updates stopping at this stop, as looked up in
+            ``trip_updates_by_stop``. Default all stops.
+
+        Yields
+        ------
+        tuple
+            Each trip update, and whether its train is stalled.
+
+        """
+        if stop_id is not None:
+            updates = (
+                x
+                for x in self.trip_updates_by_stop.get(stop_id, [])
+                if x.trip.route_is_assigned and (routes is None or x.trip.route_id in routes)
+            )
+        elif routes is not None:
+            updates = (
+                x
+                for route_id in dict.fromkeys(routes)
+                if route_id
+                for x in self.trip_updates_by_route.get(route_id, [])
+                if x.stop_time_update is not None
+            )
+        else:
+            updates = self._active_trip_updates
+
+        stalled_trips = self.stalled_trips(stalled_timeout)
+        for update in updates:
+            yield update, update.trip.trip_id in stalled_trips
+
+    def _iter_stop_times(
+        self,
+        stalled_timeout: int,
+        stop_ids: typing.Optional[typing.Collection[str]] = None,
+        routes: typing.Optional[typing.Collection[str]] = None,
+    ) -> typing.Iterator[tuple[Trip, str, datetime.datetime]]:
+        """Iterate over (trip, stop, time) tuples of upcoming stops, skipping stalled trains.
+
+        If stop IDs or routes are provided, only those stops or routes are included.
+        """
+        if stop_ids is None:
+            lookups = [(None, self.iter_trip_updates(stalled_timeout, routes))]
+        else:
+            lookups = [
+                (x, self.iter_trip_updates(stalled_timeout, routes, x))
+                for x in dict.fromkeys(stop_ids)
+            ]
+
+        for stop_id, updates in lookups:
+            for update, stalled in updates:
+                if stalled:
+                    continue
+
+                for stop in update.stop_time_update:
+                    if stop_id is not None and stop.stop_id != stop_id:
+                        continue
+                    stop_time = stop.depart_or_arrive
+                    if stop_time is not None and stop_time.time >= self.header.timestamp:
+                        yield update.trip, stop.stop_id, stop_time.time
+
     def extract_stop_dict(
-        self, timezone: str = metadata.DEFAULT_TIMEZONE, stalled_timeout: int = 90
+        self,
+        timezone: str = metadata.DEFAULT_TIMEZONE,
+        stalled_timeout: int = 90,
+        *,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        stop_ids: typing.Optional[typing.Collection[str]] = None,
+        limit: typing.Optional[int] = None,
     ) -> dict[str, dict[str, list[datetime.datetime]]]:
         """Get the departure times for all stops in the feed.
 
@@ -200,6 +690,13 @@ class SubwayFeed(pydantic.BaseModel):
             Number of seconds between the last movement of a train and the API update before
             considering a train stalled. Default is 90 as recommended by the MTA.
             Numbers less than 1 disable this check.
+        routes : collection of str, optional
+            Option to only get departures for these routes. Default all routes.
+        stop_ids : collection of str, optional
+            Option to only get departures for these stops. Default all stops.
+        limit : int, optional
+            Option to only get the first departures from each stop for each route, sorted.
+            Default all departures, in the order of the feed.
 
         Returns
         -------
@@ -208,49 +705,293 @@ class SubwayFeed(pydantic.BaseModel):
             The dictionary will be a schema like ``{route: {stop: [t1, t2]}}``.
 
         """
+        tz = zoneinfo.ZoneInfo(timezone)
+        stop_times = self._iter_stop_times(stalled_timeout, stop_ids, routes)
+        if limit is None:
+            return _group_stop_times(
+                (trip.route_id, stop_id, departure.astimezone(tz))
+                for trip, stop_id, departure in stop_times
+            )
 
-        trip_updates = (x.trip_update for x in self.entity if x.trip_update is not None)
-        vehicles = {e.vehicle.trip.trip_id: e.vehicle for e in self.entity if e.vehicle is not None}
+        # select the first times before converting them
+        stops_grouped = _sort_stop_times(
+            _group_stop_times((trip.route_id, stop_id, t) for trip, stop_id, t in stop_times),
+            limit,
+        )
+        for route_stops in stops_grouped.values():
+            for departures in route_stops.values():
+                departures[:] = [x.astimezone(tz) for x in departures]
 
-        def is_trip_active(update: TripUpdate) -> bool:
-            has_route = update.trip.route_is_assigned
-            has_stops = update.stop_time_update is not None
+        return stops_grouped
 
-            vehicle = vehicles.get(update.trip.trip_id)
-            if stalled_timeout < 1 or vehicle is None or vehicle.timestamp is None:
-                return has_route and has_stops
+    def extract_stop_epochs(
+        self,
+        stalled_timeout: int = 90,
+        *,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        stop_ids: typing.Optional[typing.Collection[str]] = None,
+        limit: typing.Optional[int] = None,
+    ) -> dict[str, dict[str, list[int]]]:
+        """Get the departure times for all stops in the feed, as sorted unix timestamps.
 
-            # as recommended by the MTA, we use these timestamps to determine if a train is stalled
-            train_stalled = (self.header.timestamp - vehicle.timestamp) > datetime.timedelta(
-                seconds=stalled_timeout
-            )
-            return has_route and has_stops and not train_stalled
-
-        # grab the updates with routes and stop times
-        trip_updates_with_stops = filter(is_trip_active, trip_updates)
-        # create (route, stop, time) tuples from each trip
-        stops_flat = (
-            (
-                trip.trip.route_id,
-                stop.stop_id,
-                (stop.depart_or_arrive).time.astimezone(zoneinfo.ZoneInfo(timezone)),
-            )
-            for trip in trip_updates_with_stops
-            for stop in trip.stop_time_update
-            if stop.depart_or_arrive is not None
-            and stop.depart_or_arrive.time >= self.header.timestamp
+        This is like ``extract_stop_dict``, but skips the timezone conversion of every stop
+        time. Use it when the times will be formatted later, or not at all.
+
+        Parameters
+        ----------
+        stalled_timeout : int
+            Number of seconds between the last movement of a train and the API update before
+            considering a train stalled. Default is 90 as recommended by the MTA.
+            Numbers less than 1 disable this check.
+        routes : collection of str, optional
+            Option to only get departures for these routes. Default all routes.
+        stop_ids : collection of str, optional
+            Option to only get departures for these stops. Default all stops.
+        limit : int, optional
+            Option to only get the first departures from each stop for each route.
+            Default all departures.
+
+        Returns
+        -------
+        dict
+            Dictionary containing train departure for all stops in the gtfs data.
+            The dictionary will be a schema like ``{route: {stop: [t1, t2]}}``, with times
+            sorted in ascending order.
+
+        """
+        stops_grouped = _group_stop_times(
+            (trip.route_id, stop_id, int(departure.timestamp()))
+            for trip, stop_id, departure in self._iter_stop_times(stalled_timeout, stop_ids, routes)
         )
+        return _sort_stop_times(stops_grouped, limit)
 
-        # group into a dict like {route: stop: [t1, t2]}
-        stops_grouped = dict()
+    @functools.cached_property
+    def _departure_indexes(self) -> dict[int, dict]:
+        """Departure indexes built by ``departures``, keyed by stalled timeout."""
+        return {}
 
-        for route_id, stop_id, departure in stops_flat:
-            if route_id not in stops_grouped:
-                stops_grouped[route_id] = dict()
+    def _departure_index(self, stalled_timeout: int) -> dict:
+        """Return an index of sorted ``(epoch, route, trip)`` tuples per stop, building it once.
 
-            if stop_id not in stops_grouped[route_id]:
-                stops_grouped[route_id][stop_id] = []
+        The index is keyed by stop ID, and by ``(stop ID, route ID)`` for route queries.
+        """
+        if stalled_timeout not in self._departure_indexes:
+            index = {}
+            for trip, stop_id, departure in self._iter_stop_times(stalled_timeout):
+                item = (int(departure.timestamp()), trip.route_id, trip.trip_id)
+                index.setdefault(stop_id, []).append(item)
+                index.setdefault((stop_id, trip.route_id), []).append(item)
+
+            for items in index.values():
+                items.sort()
+
+            self._departure_indexes[stalled_timeout] = index
+
+        return self._departure_indexes[stalled_timeout]
+
+    def departures(
+        self,
+        stop_id: str,
+        route: typing.Optional[str] = None,
+        limit: typing.Optional[int] = None,
+        after: typing.Optional[datetime.datetime] = None,
+        timezone: str = metadata.DEFAULT_TIMEZONE,
+        stalled_timeout: int = 90,
+    ) -> list[Departure]:
+        """Get the upcoming departures from a stop, soonest first.
+
+        The first call builds an index of departures for every stop in the feed, which is
+        reused by later calls on the same feed (and the same stalled timeout). Queries after
+        that only look up and slice the departures for the stop. The index is not updated if
+        the feed is modified after it is built.
 
-            stops_grouped[route_id][stop_id].append(departure)
+        Parameters
+        ----------
+        stop_id : str
+            The stop ID to get departures for.
+        route : str, optional
+            Option to only get departures for one route. Default all routes.
+        limit : int, optional
+            Maximum number of departures to return. Default all.
+        after : datetime, optional
+            Option to only get departures at or after this time. Default is all departures
+            after the feed timestamp.
+        timezone : str
+            Name of the timezone to return within. Default to NYC time.
+        stalled_timeout : int
+            Number of seconds between the last movement of a train and the API update before
+            considering a train stalled. Default is 90 as recommended by the MTA.
+            Numbers less than 1 disable this check.
 
-        return stops_grouped
+        Returns
+        -------
+        list of Departure
+            Departures like ``(time, route_id, trip_id)``, sorted by time.
+
+        """
+        key = stop_id if route is None else (stop_id, route)
+        items = self._departure_index(stalled_timeout).get(key, [])
+
+        # round up, so that an after time between seconds excludes the second before it
+        start = 0 if after is None else bisect.bisect_left(items, (math.ceil(after.timestamp()),))
+        stop = None if limit is None else start + limit
+
+        tz = zoneinfo.ZoneInfo(timezone)
+        return [
+            Departure(datetime.datetime.fromtimestamp(epoch, tz), route_id, trip_id)
+            for epoch, route_id, trip_id in items[start:stop]
+        ]
+
+    def to_stop_time_table(self, stalled_timeout: int = 90, include_stalled: bool = False):
+        """Get the stop times in the feed as a columnar table of NumPy arrays.
+
+        This requires numpy, which is an optional dependency. See ``table.from_feed`` for a
+        description of the parameters.
+
+        Returns
+        -------
+        table.StopTimeTable
+            The stop times in the feed, one row per stop time.
+
+        """
+        from underground import table  # numpy is optional, so import only when needed
+
+        return table.from_feed(
+            self, stalled_timeout=stalled_timeout, include_stalled=include_stalled
+        )
+
+
+def _entity_trip(
+    message: gtfs_realtime_pb2.FeedEntity,
+) -> typing.Optional[gtfs_realtime_pb2.TripDescriptor]:
+    """Return the TripDescriptor of a FeedEntity protobuf message, if it has one."""
+    if message.HasField("trip_update"):
+        return message.trip_update.trip
+    if message.HasField("vehicle"):
+        return message.vehicle.trip
+    return None
+
+
+class LazySubwayFeed:
+    """A feed which keeps the parsed protobuf and only builds entity models on access.
+
+    This is a drop-in for the ``header``/``entity`` API of SubwayFeed, but entities are
+    only turned into models when they are iterated, or when a filtered feed is selected.
+    Callers interested in only a few routes or trips avoid building the rest.
+    """
+
+    def __init__(self, message: gtfs_realtime_pb2.FeedMessage, trusted: bool = False):
+        self.message = message
+        self.trusted = trusted
+        self._entities: dict[int, Entity] = {}
+
+    @classmethod
+    def get(
+        cls,
+        route_or_url: str,
+        retries: int = 100,
+        trusted: bool = False,
+        session: typing.Optional[requests.Session] = None,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+        retry_policy: typing.Optional[feed.RetryPolicy] = None,
+    ) -> "LazySubwayFeed":
+        """Request feed data from the MTA. See ``SubwayFeed.get``."""
+        return feed.request_robust(
+            route_or_url=route_or_url,
+            retries=retries,
+            loader=_loader(cls, trusted, policy=policy),
+            session=session,
+            policy=policy,
+            retry_policy=retry_policy,
+        )
+
+    @classmethod
+    def from_protobuf(
+        cls,
+        protobuf_bytes: bytes,
+        trusted: bool = False,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+    ) -> "LazySubwayFeed":
+        """Create a lazy feed from protobuf bytes. See ``SubwayFeed.from_protobuf``."""
+        return cls(feed.parse_protobuf(protobuf_bytes, policy=policy), trusted=trusted)
+
+    @functools.cached_property
+    def header(self) -> FeedHeader:
+        """Return the feed header model."""
+        return FeedHeader.from_protobuf(self.message.header, self.trusted)
+
+    @property
+    def entity(self) -> list[Entity]:
+        """Return all entity models in the feed, building any not yet built."""
+        return list(self.iter_entities())
+
+    def _get_entity(self, index: int) -> Entity:
+        """Return the model for the entity at an index, building it once."""
+        if index not in self._entities:
+            message = self.message.entity[index]
+            self._entities[index] = Entity.from_protobuf(message, self.trusted)
+        return self._entities[index]
+
+    def iter_entities(
+        self,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        trip_ids: typing.Optional[typing.Collection[str]] = None,
+    ) -> typing.Iterator[Entity]:
+        """Iterate over entity models, optionally filtered by route or trip ID.
+
+        Filters are applied to the protobuf message, so entities which do not match are
+        never built into models.
+
+        Parameters
+        ----------
+        routes : collection of str, optional
+            Route IDs to include. All routes are included if not provided.
+        trip_ids : collection of str, optional
+            Trip IDs to include. All trips are included if not provided.
+
+        Yields
+        ------
+        Entity
+            Entity models matching the filters.
+
+        """
+        for index, message in enumerate(self.message.entity):
+            if routes is not None or trip_ids is not None:
+                trip = _entity_trip(message)
+                if trip is None:
+                    continue
+                if routes is not None and trip.route_id not in routes:
+                    continue
+                if trip_ids is not None and trip.trip_id not in trip_ids:
+                    continue
+
+            yield self._get_entity(index)
+
+    def select(
+        self,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        trip_ids: typing.Optional[typing.Collection[str]] = None,
+    ) -> SubwayFeed:
+        """Return a SubwayFeed holding only the entities matching the filters.
+
+        See ``iter_entities`` for a description of the filters.
+        """
+        return SubwayFeed(header=self.header, entity=list(self.iter_entities(routes, trip_ids)))
+
+    def extract_stop_dict(
+        self,
+        timezone: str = metadata.DEFAULT_TIMEZONE,
+        stalled_timeout: int = 90,
+        *,
+        routes: typing.Optional[typing.Collection[str]] = None,
+        stop_ids: typing.Optional[typing.Collection[str]] = None,
+        limit: typing.Optional[int] = None,
+    ) -> dict[str, dict[str, list[datetime.datetime]]]:
+        """Get the departure times for stops in the feed, optionally for some routes only.
+
+        See ``SubwayFeed.extract_stop_dict``, which takes the same arguments. If routes are
+        provided, only the entities for those routes are built.
+        """
+        return self.select(routes=routes).extract_stop_dict(
+            timezone, stalled_timeout, stop_ids=stop_ids, limit=limit
+        )
@@ -0,0 +1,207 @@
+"""Keep feeds up to date in the background, for fast reads of recent data."""
+
+import asyncio
+import dataclasses
+import threading
+import time
+import typing
+
+import requests
+
+from underground import feed, metadata
+from underground.models import SubwayFeed
+
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    """A feed as requested at some time.
+
+    Parameters
+    ----------
+    feed : SubwayFeed
+        The feed data.
+    url : str
+        The url the feed was requested from.
+    fetched_at : float
+        Unix time at which the feed was requested.
+    stale_after : float
+        Age in seconds after which the snapshot is considered stale.
+
+    """
+
+    feed: SubwayFeed
+    url: str
+    fetched_at: float
+    stale_after: float
+
+    @property
+    def age(self) -> float:
+        """Return the seconds since the feed was requested."""
+        return time.time() - self.fetched_at
+
+    @property
+    def feed_age(self) -> float:
+        """Return the seconds since the feed was generated by the MTA, per its header."""
+        return time.time() - self.feed.header.timestamp.timestamp()
+
+    @property
+    def stale(self) -> bool:
+        """Return whether the snapshot is older than ``stale_after``."""
+        return self.age > self.stale_after
+
+
+class FeedPoller:
+    """Request feeds on a schedule, keeping the latest snapshot of each.
+
+    Each feed is refreshed every ``interval`` seconds, either in a background thread per
+    feed (``start``) or in asyncio tasks (``run``). New snapshots replace old ones in a
+    single assignment, so ``snapshot`` never blocks and never returns a partial feed.
+    Routes served by the same URL share one feed.
+
+    Parameters
+    ----------
+    routes_or_urls : iterable of str
+        Route IDs or feed urls (per ``https://api.mta.info/#/subwayRealTimeFeeds``).
+        Use 'BUS' to poll bus updates.
+    interval : float
+        Seconds between the starts of consecutive requests for a feed. Default 15.
+    stale_after : float, optional
+        Age in seconds after which snapshots are considered stale. Default three times
+        the interval.
+    retries : int
+        Number of retry attempts per request. See ``SubwayFeed.get``. Default 3.
+    trusted : bool
+        Option to trust that the feed data conform to the GTFS schema. See
+        ``SubwayFeed.get``.
+    session : requests.Session, optional
+        Session used to make requests. See ``SubwayFeed.get``.
+    policy : feed.ValidationPolicy, optional
+        Checks the feed data must pass. See ``SubwayFeed.get``.
+    retry_policy : feed.RetryPolicy, optional
+        How to retry each request. See ``SubwayFeed.get``.
+
+    """
+
+    def __init__(
+        self,
+        routes_or_urls: typing.Iterable[str],
+        interval: float = 15,
+        stale_after: typing.Optional[float] = None,
+        retries: int = 3,
+        trusted: bool = False,
+        session: typing.Optional[requests.Session] = None,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+        retry_policy: typing.Optional[feed.RetryPolicy] = None,
+    ):
+        self.urls = {x: metadata.resolve_url(x) for x in routes_or_urls}
+        self.interval = interval
+        self.stale_after = 3 * interval if stale_after is None else stale_after
+        self.request_kwargs = dict(
+            retries=retries,
+            trusted=trusted,
+            session=session,
+            policy=policy,
+            retry_policy=retry_policy,
+        )
+
+        self.errors: dict[str, Exception] = {}
+        self._snapshots: dict[str, Snapshot] = {}
+        self._updated = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def __enter__(self) -> "FeedPoller":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def snapshot(self, route_or_url: str) -> typing.Optional[Snapshot]:
+        """Return the latest snapshot of the feed for a route or url, if there is one yet.
+
+        The route or url must be one of those being polled.
+        """
+        return self._snapshots.get(self.urls[route_or_url])
+
+    def wait(self, timeout: typing.Optional[float] = None) -> bool:
+        """Wait until there is a snapshot of every feed, returning False on timeout."""
+        urls = set(self.urls.values())
+        with self._updated:
+            return self._updated.wait_for(lambda: urls <= self._snapshots.keys(), timeout)
+
+    def refresh(self, url: str) -> typing.Optional[Snapshot]:
+        """Request a feed url now, replacing its snapshot if the request succeeds.
+
+        Errors are kept in ``errors`` rather than raised, and the previous snapshot is
+        kept.
+        """
+        fetched_at = time.time()
+        try:
+            sw_feed = SubwayFeed.get(url, **self.request_kwargs)
+        except Exception as error:
+            self.errors[url] = error
+            return None
+        return self._swap(url, sw_feed, fetched_at)
+
+    async def arefresh(self, url: str) -> typing.Optional[Snapshot]:
+        """Request a feed url now without blocking the event loop. See ``refresh``."""
+        fetched_at = time.time()
+        try:
+            sw_feed = await SubwayFeed.aget(url, **self.request_kwargs)
+        except Exception as error:
+            self.errors[url] = error
+            return None
+        return self._swap(url, sw_feed, fetched_at)
+
+    def _swap(self, url: str, sw_feed: SubwayFeed, fetched_at: float) -> Snapshot:
+        """Replace the snapshot for a url."""
+        snapshot = Snapshot(sw_feed, url, fetched_at, self.stale_after)
+        with self._updated:
+            self._snapshots[url] = snapshot
+            self.errors.pop(url, None)
+            self._updated.notify_all()
+        return snapshot
+
+    def _poll(self, url: str):
+        """Refresh a feed url on schedule until stopped."""
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            self.refresh(url)
+            next_time = max(next_time + self.interval, time.monotonic())
+            self._stop.wait(next_time - time.monotonic())
+
+    def start(self):
+        """Start polling each feed in a background thread."""
+        if self._threads:
+            raise RuntimeError("Poller is already started.")
+
+        self._stop.clear()
+        for url in set(self.urls.values()):
+            thread = threading.Thread(target=self._poll, args=(url,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: typing.Optional[float] = None):
+        """Stop polling, waiting for running requests to finish."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    async def run(self):
+        """Poll each feed until cancelled, as an alternative to ``start``.
+
+        Run this as a task, such as ``asyncio.create_task(poller.run())``, and cancel the
+        task to stop polling.
+        """
+
+        async def poll(url: str):
+            loop = asyncio.get_running_loop()
+            next_time = loop.time()
+            while True:
+                await self.arefresh(url)
+                next_time = max(next_time + self.interval, loop.time())
+                await asyncio.sleep(next_time - loop.time())
+
+        await asyncio.gather(*(poll(url) for url in set(self.urls.values())))
@@ -0,0 +1,108 @@
+"""Limit the rate of requests to each feed, across threads and processes."""
+
+import os
+import pathlib
+import threading
+import time
+import typing
+
+from underground import disk_cache
+
+
+class RateLimiter:
+    """A token bucket per feed url, limiting the rate of requests to each feed.
+
+    Each bucket holds up to ``burst`` tokens, and gains ``rate`` tokens per second. A
+    request takes a token, and must wait for one if the bucket is empty. Buckets are
+    shared by all threads using the limiter. If ``shared``, they are kept in files under
+    ``directory`` and shared by all processes using the same directory.
+
+    Parameters
+    ----------
+    rate : float
+        Requests per second allowed to each feed, in the long run. Default 1.
+    burst : int
+        Requests to each feed allowed at once, after a quiet period. Default 1.
+    shared : bool
+        Option to share the buckets with other processes, through files. Default False.
+    directory : path, optional
+        Directory for the bucket files, if shared. Default ``underground/rate`` in the
+        XDG cache directory (usually ``~/.cache/underground/rate``).
+
+    """
+
+    def __init__(
+        self,
+        rate: float = 1,
+        burst: int = 1,
+        shared: bool = False,
+        directory: typing.Optional[typing.Union[str, os.PathLike]] = None,
+    ):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate must be positive and burst at least 1.")
+
+        self.rate = rate
+        self.burst = burst
+        self.directory = None
+        if shared:
+            self.directory = pathlib.Path(directory or disk_cache.default_directory() / "rate")
+
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _take(
+        self, bucket: typing.Optional[tuple[float, float]], now: float
+    ) -> tuple[float, tuple[float, float]]:
+        """Take a token from a bucket of (tokens, updated at), if there is one.
+
+        Returns the seconds to wait for a token (zero if one was taken), and the new state
+        of the bucket.
+        """
+        tokens, updated = bucket or (self.burst, now)
+        tokens = min(self.burst, tokens + max(0, now - updated) * self.rate)
+        if tokens >= 1:
+            return 0, (tokens - 1, now)
+        return (1 - tokens) / self.rate, (tokens, now)
+
+    def _take_shared(self, url: str) -> float:
+        """Take a token from the bucket file for a url. See ``_take``."""
+        path = disk_cache.DiskCache(directory=self.directory).path(url).with_suffix(".bucket")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with disk_cache.file_lock(path.with_suffix(".lock")):
+            try:
+                tokens, updated = path.read_text().split()
+                bucket = (float(tokens), float(updated))
+            except (FileNotFoundError, ValueError):
+                bucket = None
+
+            # wall clock time, as other processes share the file
+            wait, bucket = self._take(bucket, time.time())
+            disk_cache.write_atomic(path, "{} {}".format(*bucket).encode())
+        return wait
+
+    def try_acquire(self, url: str) -> float:
+        """Take a token for a url if there is one.
+
+        Returns
+        -------
+        float
+            Zero if a token was taken, or else the seconds until one will be available.
+
+        """
+        with self._lock:
+            if self.directory is not None:
+                return self._take_shared(url)
+
+            wait, self._buckets[url] = self._take(self._buckets.get(url), time.monotonic())
+            return wait
+
+    def acquire(self, url: str, timeout: typing.Optional[float] = None) -> bool:
+        """Wait for a token for a url and take it, returning False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(url)
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
@@ -0,0 +1,232 @@
+"""Keep serving feed data while the MTA feeds are failing."""
+
+import threading
+import time
+import typing
+
+import requests
+
+from underground import feed, metadata
+from underground.models import SubwayFeed
+from underground.poller import Snapshot
+
+
+class CircuitOpenError(Exception):
+    """Thrown when a request is refused because its circuit is open."""
+
+
+class CircuitBreaker:
+    """Stop calling a failing endpoint for a while, rather than adding to its load.
+
+    The circuit starts closed, and calls go through. After ``failure_threshold``
+    consecutive failures it opens, and calls are refused. After ``reset_timeout`` seconds
+    it is half-open: one trial call goes through, and closes the circuit if it succeeds
+    or opens it again if it fails.
+
+    Parameters
+    ----------
+    failure_threshold : int
+        Number of consecutive failures after which to open the circuit. Default 5.
+    reset_timeout : float
+        Seconds for which the circuit stays open before allowing a trial call.
+        Default 60.
+
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: typing.Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Return the state of the circuit: 'closed', 'open' or 'half-open'."""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def _start(self) -> typing.Optional[bool]:
+        """Start a call if it may go through, returning whether it is a trial, or None."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "open" or self._trial_running:
+                return None
+            self._trial_running = True
+            return True
+
+    def allow(self) -> bool:
+        """Return whether a call may go through now, starting a trial if half-open."""
+        return self._start() is not None
+
+    def record_success(self):
+        """Record a successful call, closing the circuit."""
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """Record a failed call, opening the circuit if there have been too many."""
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def call(self, func: typing.Callable, *args, **kwargs) -> typing.Any:
+        """Call a function through the circuit, raising CircuitOpenError if refused."""
+        trial = self._start()
+        if trial is None:
+            raise CircuitOpenError(f"Circuit is {self.state}.")
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        else:
+            self.record_success()
+            return result
+        finally:
+            # a trial interrupted by KeyboardInterrupt or cancellation is not recorded, but
+            # must still end so that another can run
+            if trial:
+                with self._lock:
+                    self._trial_running = False
+
+
+class StaleWhileRevalidate:
+    """Serve the last good snapshot of each feed, refreshing old ones in the background.
+
+    The first request for a feed waits for the data. After that, requests are answered
+    at once from the last good snapshot. If the snapshot is older than ``max_age``, it is
+    served flagged as stale, and a new one is requested in a background thread. Failed
+    requests keep the last good snapshot. Requests for each feed go through a
+    ``CircuitBreaker``, so a failing feed is left alone for a while.
+
+    Parameters
+    ----------
+    max_age : float
+        Age in seconds after which snapshots are stale and refreshed. Default 30.
+    max_stale : float, optional
+        Age in seconds after which snapshots are not served at all, and a request waits
+        for new data (raising if it cannot get them). Stale snapshots are always served
+        if not provided.
+    failure_threshold : int
+        Consecutive failures of a feed after which its circuit opens. Default 5.
+    reset_timeout : float
+        Seconds after which an open circuit allows a trial request. Default 60.
+    retries : int
+        Number of retry attempts per request. See ``SubwayFeed.get``. Default 3.
+    trusted : bool
+        Option to trust that the feed data conform to the GTFS schema. See
+        ``SubwayFeed.get``.
+    session : requests.Session, optional
+        Session used to make requests. See ``SubwayFeed.get``.
+    policy : feed.ValidationPolicy, optional
+        Checks the feed data must pass. See ``SubwayFeed.get``.
+    retry_policy : feed.RetryPolicy, optional
+        How to retry each request. See ``SubwayFeed.get``.
+
+    """
+
+    def __init__(
+        self,
+        max_age: float = 30,
+        max_stale: typing.Optional[float] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60,
+        retries: int = 3,
+        trusted: bool = False,
+        session: typing.Optional[requests.Session] = None,
+        policy: typing.Optional[feed.ValidationPolicy] = None,
+        retry_policy: typing.Optional[feed.RetryPolicy] = None,
+    ):
+        self.max_age = max_age
+        self.max_stale = max_stale
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.request_kwargs = dict(
+            retries=retries,
+            trusted=trusted,
+            session=session,
+            policy=policy,
+            retry_policy=retry_policy,
+        )
+
+        self.errors: dict[str, Exception] = {}
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._snapshots: dict[str, Snapshot] = {}
+        self._revalidating: dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        """Return the circuit breaker for a url, creating it if needed."""
+        with self._lock:
+            if url not in self.breakers:
+                self.breakers[url] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[url]
+
+    def refresh(self, route_or_url: str) -> Snapshot:
+        """Request a feed now, through its circuit, and keep the snapshot if it succeeds."""
+        url = metadata.resolve_url(route_or_url)
+        fetched_at = time.time()
+        try:
+            sw_feed = self._breaker(url).call(SubwayFeed.get, url, **self.request_kwargs)
+        except Exception as error:
+            self.errors[url] = error
+            raise
+
+        snapshot = Snapshot(sw_feed, url, fetched_at, self.max_age)
+        self._snapshots[url] = snapshot
+        self.errors.pop(url, None)
+        return snapshot
+
+    def _revalidate(self, url: str):
+        """Refresh a url in the background, unless it is already being refreshed."""
+
+        def refresh():
+            try:
+                self.refresh(url)
+            except Exception:
+                pass  # kept in self.errors
+            finally:
+                with self._lock:
+                    del self._revalidating[url]
+
+        with self._lock:
+            if url in self._revalidating:
+                return
+            thread = threading.Thread(target=refresh, daemon=True)
+            self._revalidating[url] = thread
+            thread.start()
+
+    def get(self, route_or_url: str) -> Snapshot:
+        """Return the last good snapshot of a feed, refreshing it if it is stale.
+
+        Raises the request error (or ``CircuitOpenError``) if there is no snapshot to
+        serve and the feed cannot be requested.
+        """
+        url = metadata.resolve_url(route_or_url)
+        snapshot = self._snapshots.get(url)
+        if snapshot is None or (self.max_stale is not None and snapshot.age > self.max_stale):
+            return self.refresh(url)
+
+        if snapshot.stale and self._breaker(url).state != "open":
+            self._revalidate(url)
+
+        return snapshot
+
+    def join(self, timeout: typing.Optional[float] = None):
+        """Wait for background refreshes to finish."""
+        with self._lock:
+            threads = list(self._revalidating.values())
+        for thread in threads:
+            thread.join(timeout)
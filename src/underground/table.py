@@ -0,0 +1,120 @@
+"""Columnar stop time tables, for vectorized analysis of feed data.
+
+This module requires NumPy, which is an optional dependency. Install it with
+``pip install underground[numpy]``.
+"""
+
+import dataclasses
+import typing
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "Stop time tables require numpy. Install it with `pip install underground[numpy]`."
+    ) from e
+
+from underground import models
+
+# value used in the time columns when a time is not provided
+MISSING_TIME = -1
+
+
+@dataclasses.dataclass(frozen=True)
+class StopTimeTable:
+    """Stop times for a feed, stored as one NumPy array per column.
+
+    Route, stop and trip IDs are interned: each row holds an integer code into the array
+    of unique IDs, so ``table.route_ids[table.route]`` gives the route ID of every row.
+    Times are unix epoch seconds, with ``MISSING_TIME`` where the feed has no time. The
+    ``time`` column is the departure time, or the arrival time if there is no departure.
+    """
+
+    route_ids: np.ndarray
+    stop_ids: np.ndarray
+    trip_ids: np.ndarray
+    route: np.ndarray
+    stop: np.ndarray
+    trip: np.ndarray
+    arrival: np.ndarray
+    departure: np.ndarray
+    time: np.ndarray
+    stalled: np.ndarray
+
+    def __len__(self) -> int:
+        """Return the number of rows in the table."""
+        return len(self.time)
+
+
+def _epoch(stamp: typing.Optional[models.UnixTimestamp]) -> int:
+    """Return the epoch seconds of a timestamp model, or MISSING_TIME if there is none."""
+    if stamp is None or stamp.time is None:
+        return MISSING_TIME
+    return int(stamp.time.timestamp())
+
+
+def _intern(labels: dict[str, int], label: str) -> int:
+    """Return the integer code for a label, assigning the next code if it is new."""
+    return labels.setdefault(label, len(labels))
+
+
+def from_feed(
+    feed: models.SubwayFeed, stalled_timeout: int = 90, include_stalled: bool = False
+) -> StopTimeTable:
+    """Build a stop time table from a feed.
+
+    The same filters as ``SubwayFeed.extract_stop_dict`` apply: trips without a route or
+    stop times are skipped, as are stop times before the feed timestamp.
+
+    Parameters
+    ----------
+    feed : SubwayFeed
+        The feed to tabulate.
+    stalled_timeout : int
+        Number of seconds between the last movement of a train and the API update before
+        considering a train stalled. Default is 90 as recommended by the MTA.
+        Numbers less than 1 disable this check.
+    include_stalled : bool
+        Option to include stalled trains, rather than skipping them. Their rows are
+        flagged in the ``stalled`` column. Default False.
+
+    Returns
+    -------
+    StopTimeTable
+        The stop times in the feed.
+
+    """
+    header_time = int(feed.header.timestamp.timestamp())
+    routes, stops, trips = {}, {}, {}
+    names = ("route", "stop", "trip", "arrival", "departure", "time", "stalled")
+    columns = {name: [] for name in names}
+
+    for update, stalled in feed.iter_trip_updates(stalled_timeout):
+        if stalled and not include_stalled:
+            continue
+
+        for stop_time in update.stop_time_update:
+            time = _epoch(stop_time.depart_or_arrive)
+            if time == MISSING_TIME or time < header_time:
+                continue
+
+            columns["route"].append(_intern(routes, update.trip.route_id))
+            columns["stop"].append(_intern(stops, stop_time.stop_id))
+            columns["trip"].append(_intern(trips, update.trip.trip_id))
+            columns["arrival"].append(_epoch(stop_time.arrival))
+            columns["departure"].append(_epoch(stop_time.departure))
+            columns["time"].append(time)
+            columns["stalled"].append(stalled)
+
+    return StopTimeTable(
+        route_ids=np.array(list(routes), dtype=str),
+        stop_ids=np.array(list(stops), dtype=str),
+        trip_ids=np.array(list(trips), dtype=str),
+        route=np.array(columns["route"], dtype=np.int32),
+        stop=np.array(columns["stop"], dtype=np.int32),
+        trip=np.array(columns["trip"], dtype=np.int32),
+        arrival=np.array(columns["arrival"], dtype=np.int64),
+        departure=np.array(columns["departure"], dtype=np.int64),
+        time=np.array(columns["time"], dtype=np.int64),
+        stalled=np.array(columns["stalled"], dtype=bool),
+    )
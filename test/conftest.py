@@ -0,0 +1,127 @@
+"""Shared test fixtures."""
+
+import http.server
+import os
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+from underground import feed, metadata
+
+from . import DATA_DIR, TEST_PROTOBUFS
+
+
+class FeedServer(http.server.ThreadingHTTPServer):
+    """Local HTTP server standing in for the MTA feeds.
+
+    Every path is served ``content``, unless a response has been queued for that path
+    with ``queue``. Responses wait ``delay`` seconds, or the next of ``delays`` if any.
+    If ``etag`` is set, it is sent with the content, and requests which send it back are
+    answered with 304 Not Modified. Requests are logged in ``paths``, and ``most_active``
+    records the largest number of requests handled at the same time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, content: bytes, delay: float = 0):
+        super().__init__(("127.0.0.1", 0), FeedHandler)
+        self.content = content
+        self.delay = delay
+        self.etag = None
+        self.delays = []
+        self.queued = {}
+        self.paths = []
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        """Return the url of the server."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def url(self, route_or_url: str) -> str:
+        """Return the server url standing in for a route or feed url."""
+        return f"{self.base_url}/{urllib.parse.quote(route_or_url, safe='')}"
+
+    def queue(self, route_or_url: str, *responses: bytes):
+        """Queue responses for a route's url, served once each before ``content``."""
+        path = urllib.parse.urlsplit(self.url(route_or_url)).path
+        self.queued.setdefault(path, []).extend(responses)
+
+
+class FeedHandler(http.server.BaseHTTPRequestHandler):
+    """Serve feed data for a FeedServer."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.paths.append(self.path)
+            server.active += 1
+            server.most_active = max(server.most_active, server.active)
+            queued = server.queued.get(self.path)
+            content = queued.pop(0) if queued else server.content
+            delay = server.delays.pop(0) if server.delays else server.delay
+
+        time.sleep(delay)
+        with server.lock:
+            server.active -= 1
+
+        if server.etag is not None and self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        if server.etag is not None:
+            self.send_header("ETag", server.etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def cache_home(monkeypatch, tmp_path):
+    """Keep files cached by tests (such as the stop catalog) in a temporary directory."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+@pytest.fixture(autouse=True)
+def clear_feed_cache(monkeypatch):
+    """Start each test without feed data or latencies kept from the last."""
+    monkeypatch.setattr("underground.feed._latencies", {})
+    monkeypatch.setattr("underground.feed._cache_results", False)
+    feed.clear_cache()
+    yield
+    feed.clear_cache()
+
+
+@pytest.fixture
+def feed_server(monkeypatch):
+    """Serve a sample feed locally, and resolve routes to urls on the local server.
+
+    Routes served by the same MTA url resolve to the same local url.
+    """
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        server = FeedServer(file.read())
+
+    resolve_url = metadata.resolve_url
+
+    def resolve_local_url(route_or_url: str) -> str:
+        if route_or_url.startswith(server.base_url):
+            return route_or_url
+        return server.url(resolve_url(route_or_url))
+
+    monkeypatch.setattr("underground.metadata.resolve_url", resolve_local_url)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,186 @@
+"""Test the catalog submodule."""
+
+import io
+import json
+import math
+import threading
+import zipfile
+
+import pytest
+import requests
+from click.testing import CliRunner
+from requests_mock import ANY as requests_mock_any
+
+from underground.catalog import DATA_URLS, Stop, StopCatalog, distance, index_names
+from underground.cli import findstops as findstops_cli
+
+STOPS_TXT = """stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station
+D27,Parkside Av,40.655292,-73.961495,1,
+D27N,Parkside Av,40.655292,-73.961495,,D27
+D27S,Parkside Av,40.655292,-73.961495,,D27
+A42N,Hoyt-Schermerhorn Sts,40.688484,-73.985001,,A42
+D26N,Prospect Park,40.661614,-73.962246,,D26
+"""
+
+
+def make_zip(stops_txt: str) -> bytes:
+    """Return a static GTFS zip file holding a stops.txt file."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zpfile:
+        zpfile.writestr("stops.txt", stops_txt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def gtfs(requests_mock):
+    """Serve the sample stops for every data source."""
+    return requests_mock.get(requests_mock_any, content=make_zip(STOPS_TXT))
+
+
+def test_request_zip(gtfs):
+    """Test that zip files are streamed to a file rather than read into memory."""
+    zpfile = findstops_cli.request_data(DATA_URLS["subway"])
+    assert zpfile.read("stops.txt").decode() == STOPS_TXT
+    assert not isinstance(zpfile.fp, io.BytesIO)
+
+
+def test_index_names():
+    """Test that each word maps to the stops with it in their names."""
+    stops = [Stop(str(i), name, "", 0, 0, "subway") for i, name in enumerate(["A b", "b c b"])]
+    assert index_names(stops) == {"a": [0], "b": [0, 1], "c": [1]}
+
+
+def test_catalog_search(gtfs, tmp_path):
+    """Test that stops are found by parts of their names, in file order."""
+    catalog = StopCatalog(directory=tmp_path)
+    assert [x.stop_id for x in catalog.search("PARKSIDE")] == ["D27N", "D27S"]
+    assert [x.stop_id for x in catalog.search("side av")] == ["D27N", "D27S"]
+    assert [x.stop_id for x in catalog.search("p")] == ["D27N", "D27S", "D26N"]
+    assert catalog.search("parkside st") == []
+    assert len(catalog.search("")) == 4
+    assert catalog.search("hoyt")[0] == Stop(
+        "A42N", "Hoyt-Schermerhorn Sts", "NORTH", 40.688484, -73.985001, "subway"
+    )
+    assert gtfs.call_count == 1
+
+
+def test_catalog_buses(gtfs, tmp_path):
+    """Test that bus stops are searched after subway stops, if asked."""
+    stops = StopCatalog(directory=tmp_path).search("parkside", include_buses=True)
+    assert [x.source for x in stops] == [x for x in DATA_URLS for _ in range(2)]
+    assert {x.direction for x in stops[2:]} == {"(BUS)"}
+
+
+def test_catalog_on_disk(gtfs, tmp_path):
+    """Test that a catalog is read from disk until its ttl expires."""
+    first = StopCatalog(directory=tmp_path).search("parkside")
+    assert StopCatalog(directory=tmp_path).search("parkside") == first
+    assert gtfs.call_count == 1
+
+    assert StopCatalog(ttl=0, directory=tmp_path).search("parkside") == first
+    assert gtfs.call_count == 2
+
+
+def test_catalog_not_modified(requests_mock, tmp_path):
+    """Test that the catalog is checked with a conditional request when expired."""
+    url = DATA_URLS["subway"]
+    requests_mock.get(url, content=make_zip(STOPS_TXT), headers={"ETag": '"v1"'})
+    StopCatalog(directory=tmp_path).search("parkside")
+
+    requests_mock.get(url, status_code=304)
+    catalog = StopCatalog(ttl=0, directory=tmp_path)
+    assert len(catalog.search("parkside")) == 2
+    assert requests_mock.last_request.headers["If-None-Match"] == '"v1"'
+
+    # the check restarts the ttl
+    assert len(StopCatalog(ttl=60, directory=tmp_path).search("parkside")) == 2
+    assert requests_mock.call_count == 2
+
+
+def test_catalog_offline(requests_mock, tmp_path):
+    """Test that an expired catalog is used if the data cannot be requested."""
+    url = DATA_URLS["subway"]
+    requests_mock.get(url, content=make_zip(STOPS_TXT))
+    StopCatalog(directory=tmp_path).search("parkside")
+
+    requests_mock.get(url, exc=requests.ConnectionError)
+    assert len(StopCatalog(ttl=0, directory=tmp_path).search("parkside")) == 2
+
+    with pytest.raises(requests.ConnectionError):
+        StopCatalog(directory=tmp_path / "empty").search("parkside")
+
+
+def test_catalog_refresh(requests_mock, tmp_path):
+    """Test that refresh rebuilds the catalog from new data."""
+    url = DATA_URLS["subway"]
+    requests_mock.get(url, content=make_zip(STOPS_TXT))
+    catalog = StopCatalog(directory=tmp_path)
+    assert len(catalog.search("parkside")) == 2
+
+    requests_mock.get(url, content=make_zip(STOPS_TXT.replace("Parkside", "Lakeside")))
+    catalog.refresh()
+    assert catalog.search("parkside") == []
+    assert len(StopCatalog(directory=tmp_path).search("lakeside")) == 2
+
+
+def test_catalog_parallel(gtfs, tmp_path, monkeypatch):
+    """Test that the data sources are downloaded at the same time."""
+    barrier = threading.Barrier(len(DATA_URLS), timeout=10)
+    download = StopCatalog._download
+
+    def wait_for_all(self, source, table):
+        barrier.wait()
+        return download(self, source, table)
+
+    monkeypatch.setattr(StopCatalog, "_download", wait_for_all)
+    stops = StopCatalog(directory=tmp_path).stops(include_buses=True)
+    assert [x.source for x in stops[::4]] == list(DATA_URLS)
+    assert gtfs.call_count == len(DATA_URLS)
+
+
+def test_distance():
+    """Test great circle distances."""
+    assert distance(40.0, -74.0, 40.0, -74.0) == 0
+    assert distance(40.0, -74.0, 41.0, -74.0) == pytest.approx(111_195, rel=1e-3)
+    assert distance(0, 0, 0, 180) == pytest.approx(math.pi * 6_371_000)
+
+
+@pytest.mark.parametrize("include_buses", [False, True])
+def test_catalog_near(gtfs, tmp_path, include_buses):
+    """Test that stops near a point are found nearest first, matching a linear scan."""
+    catalog = StopCatalog(directory=tmp_path)
+    lat, lon = 40.66, -73.962
+
+    for radius in [0, 400, 800, 5000, 1e7]:
+        stops = catalog.stops(include_buses)
+        expected = [(distance(lat, lon, x.stop_lat, x.stop_lon), x) for x in stops]
+        expected = sorted((x for x in expected if x[0] <= radius), key=lambda x: x[0])
+        assert catalog.near(lat, lon, radius=radius, include_buses=include_buses) == expected
+
+    found = catalog.near(lat, lon, radius=800, limit=2)
+    assert [x.stop_id for _, x in found] == ["D26N", "D27N"]
+    assert found[0][0] < found[1][0] < 800
+
+
+def test_findstops_near(gtfs):
+    """Test the findstops --near and --limit options."""
+    args = ["--near", "40.66,-73.962", "--radius", "800", "--json"]
+    result = CliRunner().invoke(findstops_cli.main, args)
+    assert result.exit_code == 0
+    stops = json.loads(result.output)
+    assert [x["stop_id"] for x in stops] == ["D26N", "D27N", "D27S"]
+    assert stops[0]["stop_name"] == "PROSPECT PARK"
+    assert 0 < stops[0]["distance"] < stops[1]["distance"] <= 800
+
+    result = CliRunner().invoke(findstops_cli.main, ["parkside", *args, "--limit", "1"])
+    assert [x["stop_id"] for x in json.loads(result.output)] == ["D27N"]
+
+    result = CliRunner().invoke(findstops_cli.main, args[:2])
+    assert result.exit_code == 0
+    assert "Distance:" in result.output
+
+    result = CliRunner().invoke(findstops_cli.main, ["p", "--limit", "2", "--json"])
+    assert [x["stop_id"] for x in json.loads(result.output)] == ["D27N", "D27S"]
+
+    assert CliRunner().invoke(findstops_cli.main, ["--near", "40.66"]).exit_code == 2
+    assert CliRunner().invoke(findstops_cli.main, []).exit_code == 2
@@ -1,16 +1,15 @@
 """Test the CLI."""
 
-import io
 import json
 import os
 import subprocess
-import zipfile
 
 import pytest
 from click.testing import CliRunner
 from requests_mock import ANY as requests_mock_any
 
 from underground import __version__ as underground_version
+from underground import feed, metadata
 from underground.cli import feed as feed_cli
 from underground.cli import findstops as findstops_cli
 from underground.cli import stops as stops_cli
@@ -143,6 +142,100 @@ def test_stops_timezone(monkeypatch):
     assert "ONE 1969" in result.output
 
 
+def test_stops_bus(requests_mock):
+    """Test the stops cli on a single bus route."""
+    with open(os.path.join(DATA_DIR, "feed_buses_weekend.protobuf"), "rb") as file:
+        protobuf_bytes = file.read()
+
+    requests_mock.get(requests_mock_any, content=protobuf_bytes)
+    runner = CliRunner()
+    result = runner.invoke(stops_cli.main, ["M15", "--bus", "-f", "epoch", "-s", "0"])
+    assert result.exit_code == 0
+
+    expected = SubwayFeed.from_protobuf(protobuf_bytes).extract_stop_dict(stalled_timeout=0)
+    assert len(result.output.splitlines()) == len(expected["M15"])
+
+
+def test_stops_many_routes(feed_server):
+    """Test that routes sharing a feed share one request, and lines are labelled."""
+    expected = SubwayFeed.from_protobuf(feed_server.content).extract_stop_epochs(0)
+
+    runner = CliRunner()
+    result = runner.invoke(stops_cli.main, ["2", "1", "A", "1", "-f", "epoch", "-s", "0"])
+    assert result.exit_code == 0
+    assert len(feed_server.paths) == 2
+
+    lines = result.output.splitlines()
+    assert len(lines) == len(expected["1"]) + len(expected["2"])
+    assert lines[0].startswith("2 ")
+    assert lines[-1].startswith("1 ")
+
+    stop_id, departures = next(iter(expected["1"].items()))
+    assert f"1 {stop_id} {' '.join(map(str, departures))}" in lines
+
+
+def test_stops_all_routes(feed_server):
+    """Test the --all option requests each feed once."""
+    runner = CliRunner()
+    result = runner.invoke(stops_cli.main, ["--all", "-s", "0"])
+    assert result.exit_code == 0
+    assert len(feed_server.paths) == len(metadata.VALID_FEED_URLS)
+
+    expected = SubwayFeed.from_protobuf(feed_server.content).extract_stop_epochs(0)
+    routes = list(dict.fromkeys(x.split()[0] for x in result.output.splitlines()))
+    assert routes == sorted(expected)
+
+    assert runner.invoke(stops_cli.main, ["1", "--all"]).exit_code == 2
+    assert runner.invoke(stops_cli.main, []).exit_code == 2
+
+
+def test_stops_all_routes_merged(feed_server):
+    """Test that stop times of a route reported by several feeds are merged."""
+    contents = {}
+    for route, filename in [("1", "feed_26_weekday.protobuf"), ("A", "feed_26_weekend.protobuf")]:
+        with open(os.path.join(DATA_DIR, filename), "rb") as file:
+            contents[metadata.ROUTE_FEED_MAP[route]] = file.read()
+        feed_server.queue(metadata.ROUTE_FEED_MAP[route], contents[metadata.ROUTE_FEED_MAP[route]])
+
+    expected = {}
+    for url in metadata.VALID_FEED_URLS:
+        content = contents.get(url, feed_server.content)
+        for route, route_stops in SubwayFeed.from_protobuf(content).extract_stop_epochs(0).items():
+            for stop_id, departures in route_stops.items():
+                expected.setdefault((route, stop_id), []).extend(departures)
+
+    result = CliRunner().invoke(stops_cli.main, ["--all", "-f", "epoch", "-s", "0", "-n", "5"])
+    assert result.exit_code == 0
+
+    lines = result.output.splitlines()
+    assert len(lines) == len(expected)
+    for line in lines:
+        route, stop_id, *departures = line.split()
+        assert list(map(int, departures)) == sorted(expected[route, stop_id])[:5]
+
+
+def test_stops_filtered(feed_server):
+    """Test the stop and limit options."""
+    expected = SubwayFeed.from_protobuf(feed_server.content).extract_stop_epochs(0)
+    stop_ids = list(expected["1"])[:2]
+
+    runner = CliRunner()
+    args = ["1", "-f", "epoch", "-s", "0", "--stop", stop_ids[0], "--stop", stop_ids[1]]
+    result = runner.invoke(stops_cli.main, [*args, "-n", "1"])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [f"{x} {expected['1'][x][0]}" for x in stop_ids]
+
+
+def test_stops_epoch_formatter():
+    """Test that stop times are formatted in the output timezone, with caching."""
+    assert stops_cli.epoch_formatter("epoch", "UTC")(1) == "1"
+
+    format_fun = stops_cli.epoch_formatter("%Y-%m-%d %H:%M", "America/New_York")
+    assert format_fun(0) == "1969-12-31 19:00"
+    assert format_fun(0) == "1969-12-31 19:00"
+    assert format_fun.cache_info().hits == 1
+
+
 @pytest.mark.parametrize("filename", TEST_PROTOBUFS)
 def test_feed_bytes(requests_mock, filename):
     """Test the bytes output option."""
@@ -167,16 +260,32 @@ def test_feed_json(requests_mock, filename):
     assert "entity" in json.loads(result.output)
 
 
+def test_feed_retry_options(monkeypatch):
+    """Test that retry options are passed to the request as a policy."""
+    calls = []
+    monkeypatch.setattr("underground.feed.request_robust", lambda **kw: calls.append(kw) or b"")
+
+    args = ["1", "--retry-delay", "0.1", "--retry-backoff", "2", "--deadline", "5"]
+    result = CliRunner().invoke(
+        feed_cli.main, [*args, "--http-retries", "3", "--retry-max-delay", "4"]
+    )
+    assert result.exit_code == 0
+    assert calls[0]["retry_policy"] == feed.RetryPolicy(
+        delay=0.1, multiplier=2, max_delay=4, deadline=5, http_retries=3
+    )
+
+    for option in ["--retry-delay", "--retry-backoff", "--retry-max-delay", "--deadline"]:
+        assert CliRunner().invoke(feed_cli.main, ["1", option, "-1"]).exit_code == 2
+    assert CliRunner().invoke(feed_cli.main, ["1", "--retry-backoff", "0.5"]).exit_code == 2
+    assert len(calls) == 1
+
+
 @pytest.mark.parametrize("args", [["PARKSIDE"], ["parkside"], ["PARKSIDE", "av"]])
-def test_stopstxt(monkeypatch, args):
+def test_stopstxt(requests_mock, args):
     """Test the json output option."""
     with open(os.path.join(DATA_DIR, "google_transit.zip"), "rb") as file:
-        content = zipfile.ZipFile(io.BytesIO(file.read()))
+        requests_mock.get(requests_mock_any, content=file.read())
 
-    monkeypatch.setattr(
-        "underground.cli.findstops.request_data",
-        lambda *_: content,
-    )
     runner = CliRunner()
     result = runner.invoke(findstops_cli.main, args)
     assert result.exit_code == 0
@@ -185,15 +294,11 @@ def test_stopstxt(monkeypatch, args):
 
 
 @pytest.mark.parametrize("args", [["PARKSIDE"], ["parkside"], ["PARKSIDE", "av"]])
-def test_stopstxt_json(monkeypatch, args):
+def test_stopstxt_json(requests_mock, args):
     """Test the json output option."""
     with open(os.path.join(DATA_DIR, "google_transit.zip"), "rb") as file:
-        content = zipfile.ZipFile(io.BytesIO(file.read()))
+        requests_mock.get(requests_mock_any, content=file.read())
 
-    monkeypatch.setattr(
-        "underground.cli.findstops.request_data",
-        lambda *_: content,
-    )
     runner = CliRunner()
     result = runner.invoke(findstops_cli.main, [*args, "--json"])
     assert result.exit_code == 0
@@ -0,0 +1,86 @@
+"""Test the disk_cache submodule."""
+
+import os
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from underground import feed, metadata
+from underground.cli import feed as feed_cli
+from underground.disk_cache import DiskCache, default_directory
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Serve feed requests from a disk cache in a temporary directory."""
+    cache = DiskCache(ttl=60, directory=tmp_path)
+    monkeypatch.setattr("underground.feed._disk_cache", cache)
+    return cache
+
+
+def test_default_directory(monkeypatch, tmp_path):
+    """Test that the cache directory follows XDG_CACHE_HOME."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert default_directory() == tmp_path / "underground"
+
+
+def test_disk_cache_ttl(tmp_path):
+    """Test that data are served until they are older than the ttl."""
+    cache = DiskCache(ttl=10, directory=tmp_path)
+    assert cache.get("url") is None
+
+    cache.put("url", b"data")
+    assert cache.get("url") == b"data"
+    assert cache.get("other url") is None
+    assert [x.name for x in tmp_path.iterdir()] == [cache.path("url").name]
+
+    old = time.time() - 20
+    os.utime(cache.path("url"), (old, old))
+    assert cache.get("url") is None
+
+    cache.discard("url")
+    cache.discard("url")
+    assert not cache.path("url").exists()
+
+
+def test_request_disk_cache(feed_server, cache):
+    """Test that requests are served from disk, in this process or another."""
+    url = metadata.resolve_url("1")
+    assert feed.request(url) == feed_server.content
+    assert cache.get(url) == feed_server.content
+
+    # as if from another process
+    feed.clear_cache()
+    assert feed.request(url) == feed_server.content
+    assert len(feed_server.paths) == 1
+
+    cache.ttl = 0
+    assert feed.request(url) == feed_server.content
+    assert len(feed_server.paths) == 2
+
+
+def test_robust_disk_cache_incomplete(feed_server, cache):
+    """Test that incomplete data are dropped from the disk cache."""
+    url = metadata.resolve_url("1")
+    feed_server.queue(metadata.ROUTE_FEED_MAP["1"], b"")
+    assert feed.request_robust(url, retry_policy=feed.RetryPolicy(delay=0)) == feed_server.content
+    assert cache.get(url) == feed_server.content
+    assert len(feed_server.paths) == 2
+
+
+def test_cli_cache_ttl(monkeypatch, tmp_path):
+    """Test that the cache option sets a disk cache for the command only."""
+    caches = []
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(
+        "underground.feed.request_robust", lambda **kw: caches.append(feed._disk_cache) or b""
+    )
+
+    runner = CliRunner()
+    assert runner.invoke(feed_cli.main, ["1", "--cache-ttl", "5"]).exit_code == 0
+    assert runner.invoke(feed_cli.main, ["1"], env={"UNDERGROUND_CACHE_TTL": "7"}).exit_code == 0
+    assert runner.invoke(feed_cli.main, ["1"]).exit_code == 0
+    assert [x and x.ttl for x in caches] == [5, 7, None]
+    assert caches[0].directory == tmp_path / "underground"
+    assert feed._disk_cache is None
@@ -1,8 +1,11 @@
 """Test the feed submodule."""
 
+import concurrent.futures
 import os
+import threading
 import time
 
+import google
 import pytest
 import requests
 from requests_mock import ANY as requests_mock_any
@@ -29,11 +32,11 @@ def test_robust_retry_logic(requests_mock, monkeypatch, retries):
     with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
         return_value = file.read()
 
-    def mock_load_protobuf(*a):
+    def mock_parse_protobuf(*a, **k):
         raise feed.EmptyFeedError
 
     # set up mocks
-    monkeypatch.setattr("underground.feed.load_protobuf", mock_load_protobuf)
+    monkeypatch.setattr("underground.feed.parse_protobuf", mock_parse_protobuf)
     requests_mock.get(requests_mock_any, content=return_value)
 
     time_1 = time.time()
@@ -45,6 +48,65 @@ def test_robust_retry_logic(requests_mock, monkeypatch, retries):
     assert elapsed < (retries + 1)
 
 
+def test_parse_protobuf_empty():
+    """Test that an empty feed message raises on parse."""
+    with pytest.raises(feed.EmptyFeedError):
+        feed.parse_protobuf(b"")
+
+
+def test_robust_loader(requests_mock):
+    """Test that request_robust returns the result of a custom loader."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    requests_mock.get(requests_mock_any, content=return_value)
+    message = feed.request_robust("1", loader=feed.parse_protobuf)
+    assert message.SerializeToString() == feed.parse_protobuf(return_value).SerializeToString()
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_iter_entities(filename):
+    """Test that streamed entities match the parsed feed."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        protobuf_bytes = file.read()
+
+    message = feed.parse_protobuf(protobuf_bytes)
+    assert list(feed.iter_entities(protobuf_bytes)) == list(message.entity)
+
+    route_id = message.entity[0].trip_update.trip.route_id
+    entities = list(feed.iter_entities(protobuf_bytes, routes={route_id}))
+    assert entities
+    for entity in entities:
+        trip = entity.trip_update.trip if entity.HasField("trip_update") else entity.vehicle.trip
+        assert trip.route_id == route_id
+
+    filtered = feed.parse_protobuf(protobuf_bytes, routes={route_id})
+    assert list(filtered.entity) == entities
+    assert filtered.header == message.header
+
+
+def test_parse_protobuf_no_matching_routes():
+    """Test that filtering out every route is not an empty feed error."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        protobuf_bytes = file.read()
+
+    message = feed.parse_protobuf(protobuf_bytes, routes={"NOT REAL"})
+    assert not message.entity
+    assert message.HasField("header")
+
+    with pytest.raises(feed.EmptyFeedError):
+        feed.parse_protobuf(b"", routes={"1"})
+
+
+def test_parse_protobuf_routes_truncated():
+    """Test that truncated data raises a decode error when filtering routes."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        protobuf_bytes = file.read()
+
+    with pytest.raises(google.protobuf.message.DecodeError):
+        feed.parse_protobuf(protobuf_bytes[:-10], routes={"1"})
+
+
 @pytest.mark.parametrize("dict_data", [dict(), dict(a=1)])
 def test_emptyfeederror(monkeypatch, dict_data):
     """Test that empty feed is raised."""
@@ -73,3 +135,427 @@ def test_request_raise_status(requests_mock, ret_code):
             feed.request(feed_url)
     else:
         feed.request(feed_url)
+
+
+def test_make_session():
+    """Test that sessions pool connections and request compressed data."""
+    session = feed.make_session(pool_size=3, timeout=(1, 2))
+    adapter = session.get_adapter("https://api-endpoint.mta.info")
+    assert adapter._pool_maxsize == 3
+    assert adapter.timeout == (1, 2)
+    assert "gzip" in session.headers["Accept-Encoding"]
+
+    adapter = feed.make_session().get_adapter("https://api-endpoint.mta.info")
+    assert adapter.timeout == feed.DEFAULT_TIMEOUT
+
+
+def test_shared_session(monkeypatch):
+    """Test that the shared session is created once and can be replaced."""
+    monkeypatch.setattr("underground.feed._session", None)
+    session = feed.get_session()
+    assert feed.get_session() is session
+
+    custom = feed.make_session()
+    feed.set_session(custom)
+    assert feed.get_session() is custom
+
+
+def test_request_session(requests_mock):
+    """Test that requests are sent with the provided session."""
+    requests_mock.get(requests_mock_any, content=b"data")
+    session = feed.make_session()
+    session.headers["X-Test"] = "yes"
+
+    assert feed.request("1", session=session) == b"data"
+    assert requests_mock.last_request.headers["X-Test"] == "yes"
+
+
+def test_request_not_modified(feed_server):
+    """Test that unchanged feeds are not downloaded again."""
+    feed_server.etag = '"v1"'
+    assert feed.request("1") == feed_server.content
+
+    feed_server.content = b"not sent"
+    assert feed.request("1") == feed.request("1") != b"not sent"
+
+    # a new etag means new content
+    feed_server.etag = '"v2"'
+    assert feed.request("1") == b"not sent"
+
+
+def test_robust_not_modified(feed_server):
+    """Test that request_robust does not reload unchanged feeds."""
+    feed_server.etag = '"v1"'
+    feed.set_result_cache(True)
+    calls = []
+
+    def loader(protobuf_bytes):
+        calls.append(protobuf_bytes)
+        return feed.parse_protobuf(protobuf_bytes)
+
+    data = feed.request_robust("1", loader=loader)
+    assert feed.request_robust("1", loader=loader) is data
+    assert feed.request_robust("1") == feed_server.content
+    assert len(calls) == 1
+    assert len(feed_server.paths) == 3
+
+
+def test_robust_not_modified_incomplete(requests_mock, monkeypatch):
+    """Test that incomplete data are requested unconditionally on retry."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    responses = [
+        {"content": b"", "headers": {"ETag": '"v1"'}},
+        {"content": return_value, "headers": {"ETag": '"v2"'}},
+    ]
+    requests_mock.get(requests_mock_any, responses)
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    assert feed.request_robust("1", retries=1) == return_value
+
+    assert "If-None-Match" not in requests_mock.last_request.headers
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_header_timestamp(filename):
+    """Test that the header timestamp is scanned without parsing."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        protobuf_bytes = file.read()
+
+    header = feed.parse_protobuf(protobuf_bytes).header
+    assert feed._header_timestamp(protobuf_bytes) == header.timestamp
+    assert feed._header_timestamp(protobuf_bytes[:3]) is None
+
+
+def test_robust_unchanged(requests_mock):
+    """Test that identical feed data are not reloaded."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[1]), "rb") as file:
+        other_value = file.read()
+
+    feed.set_result_cache(True)
+    calls = []
+
+    def loader(protobuf_bytes):
+        calls.append(protobuf_bytes)
+        return feed.parse_protobuf(protobuf_bytes)
+
+    responses = [{"content": x} for x in (return_value, bytes(return_value), other_value)]
+    requests_mock.get(requests_mock_any, responses)
+
+    data = feed.request_robust("1", loader=loader)
+    assert feed.request_robust("1", loader=loader) is data
+    assert feed.request_robust("1", loader=loader) == feed.parse_protobuf(other_value)
+    assert calls == [return_value, other_value]
+
+
+def test_result_cache(feed_server):
+    """Test that results are only kept if result caching is on, and never dicts."""
+    feed_server.etag = '"v1"'
+    calls = []
+
+    def loader(protobuf_bytes):
+        calls.append(protobuf_bytes)
+        return feed.parse_protobuf(protobuf_bytes)
+
+    assert feed.request_robust("1", loader=loader) is not feed.request_robust("1", loader=loader)
+    assert len(calls) == 2
+
+    feed.set_result_cache(True)
+    data = feed.request_robust("1", return_dict=True)
+    data["entity"].clear()
+    assert feed.request_robust("1", return_dict=True) == feed.load_protobuf(feed_server.content)
+
+    data = feed.request_robust("1", loader=loader)
+    assert feed.request_robust("1", loader=loader) is data
+    feed.set_result_cache(False)
+    assert feed.request_robust("1", loader=loader) is not data
+    assert len(calls) == 4
+
+
+def test_cache_eviction(requests_mock, monkeypatch):
+    """Test that the least recently requested urls are evicted from the cache."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    calls = []
+
+    def loader(protobuf_bytes):
+        calls.append(protobuf_bytes)
+        return protobuf_bytes
+
+    monkeypatch.setattr("underground.feed.CACHE_SIZE", 1)
+    feed.set_result_cache(True)
+    requests_mock.get(requests_mock_any, content=return_value)
+    for route in ("1", "1", "A", "1"):
+        feed.request_robust(route, loader=loader)
+
+    assert len(calls) == 3
+
+
+def test_robust_bytes_not_converted(requests_mock, monkeypatch):
+    """Test that raw data are validated without converting them to a dict."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    def mock_protobuf_to_dict(*a):
+        raise AssertionError("converted to dict")
+
+    requests_mock.get(requests_mock_any, content=return_value)
+    monkeypatch.setattr("protobuf_to_dict.protobuf_to_dict", mock_protobuf_to_dict)
+    assert feed.request_robust("1") == return_value
+
+
+@pytest.mark.parametrize("return_dict", [True, False])
+def test_robust_policy_entities(requests_mock, return_dict):
+    """Test that feeds with too few entities are rejected."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    requests_mock.get(requests_mock_any, content=return_value)
+    count = len(feed.parse_protobuf(return_value).entity)
+
+    policy = feed.ValidationPolicy(min_entities=count)
+    assert feed.request_robust("1", retries=0, return_dict=return_dict, policy=policy)
+
+    policy = feed.ValidationPolicy(min_entities=count + 1)
+    with pytest.raises(feed.InvalidFeedError, match="entities"):
+        feed.request_robust("1", retries=0, return_dict=return_dict, policy=policy)
+
+
+def test_robust_policy_age(requests_mock, monkeypatch):
+    """Test that stale feeds are rejected, even if they are unchanged."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    requests_mock.get(requests_mock_any, content=return_value)
+    timestamp = feed.parse_protobuf(return_value).header.timestamp
+    policy = feed.ValidationPolicy(max_age=60)
+
+    monkeypatch.setattr("time.time", lambda: timestamp + 30)
+    assert feed.request_robust("1", retries=0, policy=policy) == return_value
+
+    monkeypatch.setattr("time.time", lambda: timestamp + 90)
+    with pytest.raises(feed.StaleFeedError):
+        feed.request_robust("1", retries=0, policy=policy)
+
+
+def test_retry_policy_wait(monkeypatch):
+    """Test that retry waits grow up to the maximum, less jitter."""
+    policy = feed.RetryPolicy(delay=0.1, multiplier=2, max_delay=0.3)
+    assert [policy.wait(n) for n in range(4)] == pytest.approx([0.1, 0.2, 0.3, 0.3])
+    assert policy.wait(10_000) == 0.3
+
+    monkeypatch.setattr("random.random", lambda: 0.5)
+    assert feed.RetryPolicy(delay=1, jitter=0.5).wait(0) == 0.75
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(delay=-1),
+        dict(max_delay=-1),
+        dict(deadline=-1),
+        dict(multiplier=0.5),
+        dict(jitter=-0.1),
+        dict(jitter=1.5),
+        dict(http_retries=-2),
+    ],
+)
+def test_retry_policy_invalid(kwargs):
+    """Test that retry policies which would wait a negative time are rejected."""
+    with pytest.raises(ValueError):
+        feed.RetryPolicy(**kwargs)
+
+
+@pytest.mark.parametrize("http_retries", [0, 1])
+def test_robust_http_retries(requests_mock, http_retries):
+    """Test that transient HTTP errors are retried separately from incomplete data."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    responses = [{"status_code": 503}, {"content": return_value}]
+    requests_mock.get(requests_mock_any, responses)
+    policy = feed.RetryPolicy(delay=0, http_retries=http_retries)
+
+    if http_retries:
+        assert feed.request_robust("1", retries=0, retry_policy=policy) == return_value
+    else:
+        with pytest.raises(requests.exceptions.HTTPError):
+            feed.request_robust("1", retries=0, retry_policy=policy)
+
+
+def test_robust_http_client_error(requests_mock):
+    """Test that HTTP client errors are not retried."""
+    requests_mock.get(requests_mock_any, status_code=404)
+    policy = feed.RetryPolicy(delay=0, http_retries=5)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        feed.request_robust("1", retry_policy=policy)
+    assert requests_mock.call_count == 1
+
+
+def test_robust_deadline(requests_mock):
+    """Test that retries stop at the deadline."""
+    requests_mock.get(requests_mock_any, content=b"")
+    policy = feed.RetryPolicy(delay=0.2, deadline=0.5)
+
+    time_1 = time.time()
+    with pytest.raises(feed.EmptyFeedError):
+        feed.request_robust("1", retries=-1, retry_policy=policy)
+    elapsed = time.time() - time_1
+
+    assert 0.4 <= elapsed < 1
+    assert requests_mock.call_count == 3
+
+
+def test_request_timeout(feed_server):
+    """Test that requests time out if the server is slow to respond."""
+    feed_server.delay = 1
+    with pytest.raises(requests.exceptions.Timeout):
+        feed.request("1", session=feed.make_session(timeout=0.2))
+
+
+def test_latency_histogram():
+    """Test latency histogram quantiles."""
+    histogram = feed.LatencyHistogram(buckets=[0.1, 0.2, 0.4])
+    assert histogram.quantile(0.5) is None
+
+    for seconds in [0.05, 0.15, 0.15, 0.3, 0.5]:
+        histogram.record(seconds)
+
+    assert histogram.total == 5
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.quantile(0.2) == 0.1
+    assert histogram.quantile(0.5) == 0.2
+    assert histogram.quantile(0.8) == 0.4
+    assert histogram.quantile(1) == float("inf")
+
+
+def test_request_latency_recorded(feed_server):
+    """Test that request latencies are recorded per feed."""
+    feed.request("1")
+    feed.request("2")
+    assert feed.latency_histogram("1").total == 2
+    assert feed.latency_histogram("A").total == 0
+
+
+def test_hedge_policy():
+    """Test that hedging waits for a latency quantile once there are enough samples."""
+    histogram = feed.LatencyHistogram(buckets=[0.1, 0.2])
+    policy = feed.HedgePolicy(quantile=0.5, delay=3, min_samples=2)
+    assert policy.hedge_after(histogram) == 3
+
+    histogram.record(0.15)
+    histogram.record(0.15)
+    assert policy.hedge_after(histogram) == 0.2
+
+    # above the last bucket
+    for _ in range(4):
+        histogram.record(60)
+    assert policy.hedge_after(histogram) is None
+
+
+def test_robust_not_hedged_slow_feed(feed_server, monkeypatch):
+    """Test that requests to a feed slower than every histogram bucket are not hedged."""
+    monkeypatch.setattr("underground.feed._hedge_policy", None)
+    feed.set_hedge_policy(feed.HedgePolicy(min_samples=1))
+    feed.latency_histogram("1").record(60)
+
+    assert feed.request_robust("1") == feed_server.content
+    assert len(feed_server.paths) == 1
+
+
+def test_request_hedged_prefers_response(monkeypatch):
+    """Test that a response is used over an error when both requests have finished."""
+    calls = []
+
+    def timed_get(session, url, headers):
+        calls.append(url)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            raise requests.ConnectionError
+        time.sleep(0.1)
+        return "response"
+
+    wait = concurrent.futures.wait
+
+    def wait_for_both(*args, **kwargs):
+        time.sleep(0.5)
+        return wait(*args, **kwargs)
+
+    monkeypatch.setattr("underground.feed._timed_get", timed_get)
+    monkeypatch.setattr("concurrent.futures.wait", wait_for_both)
+    policy = feed.HedgePolicy(delay=0.05)
+    assert feed._hedged_get(None, metadata.resolve_url("1"), {}, policy) == "response"
+    assert len(calls) == 2
+
+
+def test_request_hedged(feed_server, monkeypatch):
+    """Test that a slow request is hedged, and the faster response used."""
+    monkeypatch.setattr("underground.feed._hedge_policy", None)
+    feed.set_hedge_policy(feed.HedgePolicy(delay=0.1))
+    feed_server.delays = [2]
+
+    time_1 = time.time()
+    assert feed.request("1") == feed_server.content
+    assert time.time() - time_1 < 1
+    assert len(feed_server.paths) == 2
+
+
+def test_request_not_hedged(feed_server, monkeypatch):
+    """Test that a fast request is not hedged."""
+    monkeypatch.setattr("underground.feed._hedge_policy", None)
+    feed.set_hedge_policy(feed.HedgePolicy(delay=1))
+
+    assert feed.request("1") == feed_server.content
+    assert len(feed_server.paths) == 1
+
+
+def test_robust_coalesced_errors(feed_server):
+    """Test that concurrent requests sharing a request all get its error."""
+    feed_server.delay = 0.5
+    feed_server.queue(metadata.ROUTE_FEED_MAP["1"], b"")
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def get():
+        barrier.wait()
+        try:
+            feed.request_robust("1", retries=0)
+        except feed.EmptyFeedError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4
+    assert len(feed_server.paths) == 1
+    assert not feed._in_flight._calls
+
+
+def test_robust_coalesced_per_session(feed_server):
+    """Test that concurrent requests with different sessions do not share a request."""
+    feed_server.delay = 0.5
+    sessions = [feed.make_session() for _ in range(2)]
+    used = []
+    for session in sessions:
+        session.hooks["response"].append(lambda res, s=session, **kwargs: used.append(s))
+    barrier = threading.Barrier(4)
+
+    def get(session):
+        barrier.wait()
+        feed.request_robust("1", session=session)
+
+    threads = [threading.Thread(target=get, args=(x,)) for x in sessions * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(feed_server.paths) == 2
+    assert sorted(map(id, used)) == sorted(map(id, sessions))
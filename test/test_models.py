@@ -1,14 +1,17 @@
 """Data model tests."""
 
+import asyncio
 import datetime
+import inspect
 import os
+import threading
 
 import pytest
 import zoneinfo
 from requests_mock import ANY as requests_mock_any
 
-from underground import SubwayFeed, models
-from underground.feed import load_protobuf
+from underground import LazySubwayFeed, SubwayFeed, metadata, models
+from underground.feed import InvalidFeedError, ValidationPolicy, load_protobuf, set_result_cache
 from underground.metadata import DEFAULT_TIMEZONE
 
 from . import DATA_DIR, TEST_PROTOBUFS
@@ -74,6 +77,388 @@ def test_on_sample_protobufs(filename):
     assert isinstance(feed.extract_stop_dict(), dict)
 
 
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_from_protobuf(filename):
+    """Test that the direct protobuf decoder matches the dict-based path."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        protobuf_bytes = file.read()
+
+    feed = SubwayFeed.from_protobuf(protobuf_bytes)
+    expected = SubwayFeed(**load_protobuf(protobuf_bytes))
+    assert feed == expected
+    assert feed.model_dump() == expected.model_dump()
+    assert feed.extract_stop_dict() == expected.extract_stop_dict()
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_from_protobuf_routes(filename):
+    """Test that filtering routes while decoding matches the full feed."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        protobuf_bytes = file.read()
+
+    stops = SubwayFeed.from_protobuf(protobuf_bytes).extract_stop_dict()
+    routes = sorted(stops)
+    for route in {routes[0], routes[-1]}:
+        feed = SubwayFeed.from_protobuf(protobuf_bytes, routes={route})
+        assert feed.extract_stop_dict() == {route: stops[route]}
+
+    assert SubwayFeed.from_protobuf(protobuf_bytes, routes={"NOT A ROUTE"}).entity == []
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_from_protobuf_trusted(filename):
+    """Test that the trusted decoder matches the validated decoder on real data."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        protobuf_bytes = file.read()
+
+    feed = SubwayFeed.from_protobuf(protobuf_bytes, trusted=True)
+    expected = SubwayFeed.from_protobuf(protobuf_bytes)
+    assert feed.model_dump() == expected.model_dump()
+    assert feed.extract_stop_dict() == expected.extract_stop_dict()
+
+
+@pytest.mark.parametrize("trusted", [True, False])
+def test_get_trusted(requests_mock, trusted):
+    """Test the get method in trusted and validated modes."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    requests_mock.get(requests_mock_any, content=return_value)
+    feed = SubwayFeed.get("1", trusted=trusted)
+    assert feed == SubwayFeed(**load_protobuf(return_value))
+
+
+def test_aget(requests_mock):
+    """Test the async get method."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    requests_mock.get(requests_mock_any, content=return_value)
+    feed = asyncio.run(SubwayFeed.aget("1"))
+    assert feed == SubwayFeed.from_protobuf(return_value)
+
+
+def test_get_policy(feed_server):
+    """Test that the validation policy is applied to feeds."""
+    count = len(SubwayFeed.get("1").entity)
+    policy = ValidationPolicy(min_entities=count + 1)
+
+    with pytest.raises(InvalidFeedError):
+        SubwayFeed.get("1", retries=0, policy=policy)
+    with pytest.raises(InvalidFeedError):
+        LazySubwayFeed.get("1", retries=0, policy=policy)
+
+
+def test_get_not_modified(feed_server):
+    """Test that an unchanged feed is not parsed again."""
+    feed_server.etag = '"v1"'
+    set_result_cache(True)
+    sw_feed = SubwayFeed.get("1")
+    assert SubwayFeed.get("1") is sw_feed
+    assert SubwayFeed.get("1", routes={"1"}) is not sw_feed
+    assert len(feed_server.paths) == 3
+
+
+def test_loader_memo_bounded():
+    """Test that loaders are reused for the same arguments, and not kept without bound."""
+    loader = models._loader(SubwayFeed, False, frozenset({"M15"}))
+    assert models._loader(SubwayFeed, False, frozenset({"M15"})) is loader
+
+    for i in range(1000):
+        models._loader(SubwayFeed, False, frozenset({f"M{i}"}))
+    info = models._loader.cache_info()
+    assert info.currsize <= info.maxsize < 1000
+
+
+def test_get_coalesced(feed_server):
+    """Test that concurrent requests for routes on one feed share a request."""
+    feed_server.delay = 0.5
+    routes = ["N", "Q", "R", "W"] * 3
+    barrier = threading.Barrier(len(routes))
+    feeds = [None] * len(routes)
+
+    def get(index, route):
+        barrier.wait()
+        feeds[index] = SubwayFeed.get(route)
+
+    threads = [threading.Thread(target=get, args=x) for x in enumerate(routes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(feed_server.paths) == 1
+    assert all(x is feeds[0] for x in feeds)
+
+
+def test_aget_coalesced(feed_server):
+    """Test that concurrent async requests for routes on one feed share a request."""
+    feed_server.delay = 0.5
+
+    async def get_all():
+        return await asyncio.gather(*(SubwayFeed.aget(x) for x in ["N", "Q", "R", "W"]))
+
+    feeds = asyncio.run(get_all())
+    assert len(feed_server.paths) == 1
+    assert all(x is feeds[0] for x in feeds)
+
+
+def test_get_many(feed_server):
+    """Test that get_many requests each feed url once, concurrently."""
+    feed_server.delay = 0.5
+    feeds = asyncio.run(SubwayFeed.get_many(["1", "2", "A", "G", "BUS"]))
+
+    # 1 and 2 share a feed, so four urls are requested at once
+    assert len(feed_server.paths) == 4
+    assert feed_server.most_active == 4
+    assert set(feeds) == {"1", "2", "A", "G", "BUS"}
+    assert feeds["1"] is feeds["2"]
+    assert feeds["A"] == SubwayFeed.from_protobuf(feed_server.content)
+
+
+def test_get_many_retries(feed_server):
+    """Test that an incomplete feed is retried without failing the others."""
+    feed_server.queue(metadata.ROUTE_FEED_MAP["A"], b"")
+    feeds = asyncio.run(SubwayFeed.get_many(["1", "A"], retries=1))
+
+    assert feeds["A"] == feeds["1"]
+    assert len(feed_server.paths) == 3
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_lazy_feed(filename):
+    """Test that the lazy feed matches the eager feed."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        protobuf_bytes = file.read()
+
+    lazy = LazySubwayFeed.from_protobuf(protobuf_bytes)
+    eager = SubwayFeed.from_protobuf(protobuf_bytes)
+    stops = eager.extract_stop_dict()
+
+    assert lazy.header == eager.header
+    assert lazy.entity == eager.entity
+    assert lazy.extract_stop_dict() == stops
+
+    for route in stops:
+        assert lazy.extract_stop_dict(routes={route}) == {route: stops[route]}
+
+    stop_ids = {x for route_stops in stops.values() for x in list(route_stops)[:2]}
+    kwargs = dict(routes=list(stops)[:2], stop_ids=stop_ids, limit=1)
+    assert lazy.extract_stop_dict("UTC", 0, **kwargs) == eager.extract_stop_dict("UTC", 0, **kwargs)
+
+
+def test_lazy_feed_signature():
+    """Test that the lazy feed takes the same stop dict arguments as the eager feed."""
+    lazy = inspect.signature(LazySubwayFeed.extract_stop_dict)
+    assert lazy == inspect.signature(SubwayFeed.extract_stop_dict)
+
+
+def test_lazy_feed_filters():
+    """Test that lazy feed filters only build the matching entities."""
+    with open(os.path.join(DATA_DIR, "feed_buses_weekend.protobuf"), "rb") as file:
+        lazy = LazySubwayFeed.from_protobuf(file.read())
+
+    entities = list(lazy.iter_entities(routes={"M15"}))
+    assert entities
+    assert all(x.trip_update.trip.route_id == "M15" for x in entities)
+    assert len(lazy._entities) == len(entities)
+
+    trip_id = entities[0].trip_update.trip.trip_id
+    feed = lazy.select(trip_ids={trip_id})
+    assert isinstance(feed, SubwayFeed)
+    assert feed.entity
+    assert all(x.trip_update.trip.trip_id == trip_id for x in feed.entity)
+
+
+def test_lazy_get(requests_mock):
+    """Test the get method of the lazy feed."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        return_value = file.read()
+
+    requests_mock.get(requests_mock_any, content=return_value)
+    lazy = LazySubwayFeed.get("1")
+    assert isinstance(lazy, LazySubwayFeed)
+    assert lazy.extract_stop_dict() == SubwayFeed.from_protobuf(return_value).extract_stop_dict()
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_extract_stop_epochs(filename):
+    """Test that the epoch stop times match the datetime stop times."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    expected = {
+        route_id: {
+            stop_id: sorted(int(x.timestamp()) for x in times)
+            for stop_id, times in route_stops.items()
+        }
+        for route_id, route_stops in feed.extract_stop_dict().items()
+    }
+    assert feed.extract_stop_epochs() == expected
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS[::4])
+def test_extract_stop_filtered(filename):
+    """Test that stop times can be limited to some stops and the first times."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    epochs = feed.extract_stop_epochs()
+    stop_ids = {stop_id for route_stops in epochs.values() for stop_id in route_stops}
+    stop_ids = set(sorted(stop_ids)[::5])
+
+    expected = {
+        route_id: {x: times[:2] for x, times in route_stops.items() if x in stop_ids}
+        for route_id, route_stops in epochs.items()
+    }
+    expected = {route_id: x for route_id, x in expected.items() if x}
+    assert feed.extract_stop_epochs(stop_ids=stop_ids, limit=2) == expected
+
+    stop_dict = feed.extract_stop_dict(timezone="UTC", stop_ids=stop_ids, limit=2)
+    assert stop_dict.keys() == expected.keys()
+    for route_id, route_stops in stop_dict.items():
+        for stop_id, times in route_stops.items():
+            assert [int(x.timestamp()) for x in times] == expected[route_id][stop_id]
+            assert all(x.tzinfo.key == "UTC" for x in times)
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_departures(filename):
+    """Test that stop departures match the stop dict."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    stops = feed.extract_stop_dict()
+    for route_id, route_stops in stops.items():
+        for stop_id, times in route_stops.items():
+            departures = feed.departures(stop_id, route=route_id)
+            assert [x.time for x in departures] == sorted(times)
+            assert all(x.route_id == route_id for x in departures)
+
+            all_departures = feed.departures(stop_id)
+            assert len(all_departures) == sum(len(x.get(stop_id, [])) for x in stops.values())
+
+    assert len(feed._departure_indexes) == 1
+
+
+def test_departures_query():
+    """Test the limit, after and timezone options for stop departures."""
+    sample_data = {
+        "header": {"gtfs_realtime_version": "1.0", "timestamp": 0},
+        "entity": [
+            {
+                "id": "1",
+                "trip_update": {
+                    "trip": {"trip_id": "X", "start_date": "20190726", "route_id": "1"},
+                    "stop_time_update": [{"arrival": {"time": 3}, "stop_id": "ONE"}],
+                },
+            },
+            {
+                "id": "2",
+                "trip_update": {
+                    "trip": {"trip_id": "Y", "start_date": "20190726", "route_id": "2"},
+                    "stop_time_update": [{"arrival": {"time": 1}, "stop_id": "ONE"}],
+                },
+            },
+        ],
+    }
+    feed = SubwayFeed(**sample_data)
+    utc = zoneinfo.ZoneInfo("UTC")
+
+    departures = feed.departures("ONE", timezone="UTC")
+    assert [(x.route_id, x.trip_id) for x in departures] == [("2", "Y"), ("1", "X")]
+    assert departures[0].time == datetime.datetime(1970, 1, 1, 0, 0, 1, tzinfo=utc)
+    assert departures[0].time.tzinfo == utc
+
+    assert [x.trip_id for x in feed.departures("ONE", limit=1)] == ["Y"]
+    assert [x.trip_id for x in feed.departures("ONE", route="1")] == ["X"]
+
+    after = datetime.datetime(1970, 1, 1, 0, 0, 2, tzinfo=utc)
+    assert [x.trip_id for x in feed.departures("ONE", after=after)] == ["X"]
+
+    # departures are at whole seconds, so none are before an after time between seconds
+    after = datetime.datetime(1970, 1, 1, 0, 0, 1, 500000, tzinfo=utc)
+    assert [x.trip_id for x in feed.departures("ONE", after=after)] == ["X"]
+    after = datetime.datetime(1970, 1, 1, 0, 0, 0, 500000, tzinfo=utc)
+    assert [x.trip_id for x in feed.departures("ONE", after=after)] == ["Y", "X"]
+    assert feed.departures("NOT REAL") == []
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_iter_trip_updates(filename):
+    """Test that trip updates are filtered by route and stop, and flagged if stalled."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    updates = list(feed.iter_trip_updates(stalled_timeout=0))
+    assert updates and not any(stalled for _, stalled in updates)
+    stalled = {x.trip.trip_id for x, stalled in feed.iter_trip_updates() if stalled}
+    assert stalled == feed.stalled_trips() & {x.trip.trip_id for x, _ in updates}
+
+    update = updates[0][0]
+    route_id, stop_id = update.trip.route_id, update.stop_time_update[0].stop_id
+    assert all(x.trip.route_id == route_id for x, _ in feed.iter_trip_updates(routes={route_id}))
+    assert update in [x for x, _ in feed.iter_trip_updates(stop_id=stop_id)]
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_indexes(filename):
+    """Test the cached trip, route and stop indexes."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    for trip_id, vehicle in feed.vehicles_by_trip.items():
+        assert vehicle.trip.trip_id == trip_id
+
+    updates = [x.trip_update for x in feed.entity if x.trip_update is not None]
+    assert sum(map(len, feed.trip_updates_by_route.values())) == len(updates)
+    for route_id, route_updates in feed.trip_updates_by_route.items():
+        assert all(x.trip.route_id == route_id for x in route_updates)
+
+    for stop_id, stop_updates in feed.trip_updates_by_stop.items():
+        assert all(stop_id in {x.stop_id for x in u.stop_time_update} for u in stop_updates)
+
+    # indexes are built once and reused
+    assert feed.trip_updates_by_route is feed.trip_updates_by_route
+    assert feed.extract_stop_dict() == feed.extract_stop_dict()
+    assert feed.stalled_trips() is feed.stalled_trips()
+
+
+def test_indexes_dropped():
+    """Test that cached indexes are not kept by copies with new data, or new data."""
+    with open(os.path.join(DATA_DIR, TEST_PROTOBUFS[0]), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    assert feed.vehicles_by_trip and feed.extract_stop_epochs()
+    copied = feed.model_copy(update={"entity": []})
+    assert copied.vehicles_by_trip == {}
+    assert copied.extract_stop_epochs() == {}
+    assert feed.model_copy().vehicles_by_trip == feed.vehicles_by_trip
+
+    feed.entity = []
+    assert feed.trip_updates_by_route == {}
+    assert feed.departures("101N") == []
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS[::4])
+def test_extract_stop_routes(filename):
+    """Test that stop times can be limited to some routes, and to routes and stops."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    epochs = feed.extract_stop_epochs()
+    routes = sorted(epochs)[::2]
+    assert feed.extract_stop_epochs(routes=routes) == {x: epochs[x] for x in routes}
+    assert feed.extract_stop_dict(routes=routes).keys() == set(routes)
+
+    stop_ids = {stop_id for x in routes for stop_id in list(epochs[x])[:3]}
+    expected = {
+        route_id: {x: times for x, times in epochs[route_id].items() if x in stop_ids}
+        for route_id in routes
+    }
+    assert feed.extract_stop_epochs(stop_ids=stop_ids, routes=routes) == expected
+
+
 @pytest.mark.parametrize("filename", TEST_PROTOBUFS)
 def test_get(requests_mock, filename):
     """Test the get method creates the desired object."""
@@ -194,6 +579,11 @@ def test_extract_dict_stalled_train_omitted():
     stops_long_timeout = feed.extract_stop_dict(stalled_timeout=900)
     assert len(stops_long_timeout["F"]["D17S"]) == 2
 
+    assert feed.stalled_trips() == {"128000_F..S"}
+    assert feed.stalled_trips(0) == set()
+    assert feed.stalled_trips(900) == set()
+    assert set(feed._stalled_trips) == {0, 90, 900}
+
 
 def test_empty_route_id():
     """Test the route functionality when the route id is a blank string.
@@ -0,0 +1,87 @@
+"""Test the poller submodule."""
+
+import asyncio
+import time
+
+import pytest
+
+from underground import metadata
+from underground.models import SubwayFeed
+from underground.poller import FeedPoller, Snapshot
+
+
+def test_snapshot_age():
+    """Test snapshot age and staleness."""
+    sw_feed = SubwayFeed(
+        header={"gtfs_realtime_version": "1.0", "timestamp": time.time() - 100}, entity=[]
+    )
+    snapshot = Snapshot(sw_feed, "url", fetched_at=time.time() - 10, stale_after=20)
+    assert 10 <= snapshot.age < 11
+    assert 100 <= snapshot.feed_age < 101
+    assert not snapshot.stale
+
+    snapshot = Snapshot(sw_feed, "url", fetched_at=time.time() - 30, stale_after=20)
+    assert snapshot.stale
+
+
+def test_poller_threads(feed_server):
+    """Test that the poller refreshes each feed in the background."""
+    with FeedPoller(["1", "2", "A"], interval=0.2, stale_after=60) as poller:
+        assert poller.snapshot("1") is None or poller.snapshot("1").feed
+        assert poller.wait(timeout=10)
+
+        first = poller.snapshot("1")
+        assert first is poller.snapshot("2")
+        assert first.feed == SubwayFeed.from_protobuf(feed_server.content)
+        assert first.url == metadata.resolve_url("1")
+        assert not first.stale
+
+        deadline = time.time() + 10
+        while poller.snapshot("1") is first and time.time() < deadline:
+            time.sleep(0.05)
+        assert poller.snapshot("1").fetched_at > first.fetched_at
+
+    # two feeds, each requested at least twice
+    assert len(set(feed_server.paths)) == 2
+    assert len(feed_server.paths) >= 4
+
+
+def test_poller_keeps_snapshot_on_error(feed_server):
+    """Test that a failed refresh keeps the last snapshot and records the error."""
+    poller = FeedPoller(["1"], retries=0)
+    url = poller.urls["1"]
+    snapshot = poller.refresh(url)
+    assert snapshot is poller.snapshot("1")
+
+    feed_server.queue(metadata.ROUTE_FEED_MAP["1"], b"")
+    assert poller.refresh(url) is None
+    assert poller.snapshot("1") is snapshot
+    assert url in poller.errors
+
+    assert poller.refresh(url) is not snapshot
+    assert not poller.errors
+
+
+def test_poller_unknown_route():
+    """Test that only polled routes can be read."""
+    with pytest.raises(metadata.UnknownRouteOrURL):
+        FeedPoller(["not a route"])
+
+    poller = FeedPoller(["1"])
+    with pytest.raises(KeyError):
+        poller.snapshot("A")
+
+
+def test_poller_async(feed_server):
+    """Test polling in an asyncio task."""
+    poller = FeedPoller(["1", "A"], interval=0.2)
+
+    async def poll():
+        task = asyncio.create_task(poller.run())
+        while not poller.wait(timeout=0) or len(feed_server.paths) < 4:
+            await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(poll())
+    assert poller.snapshot("A").feed == SubwayFeed.from_protobuf(feed_server.content)
+    assert len(feed_server.paths) >= 4
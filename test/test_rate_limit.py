@@ -0,0 +1,144 @@
+"""Test the rate_limit submodule."""
+
+import threading
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from underground import feed, metadata
+from underground.cli import feed as feed_cli
+from underground.disk_cache import DiskCache
+from underground.rate_limit import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Control the time seen by rate limiters."""
+    now = [1000.0]
+    monkeypatch.setattr("time.monotonic", lambda: now[0])
+    monkeypatch.setattr("time.time", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_rate_limiter(clock, tmp_path, shared):
+    """Test that tokens are taken up to the burst, and refill at the rate."""
+    limiter = RateLimiter(rate=2, burst=2, shared=shared, directory=tmp_path)
+    assert limiter.try_acquire("url") == 0
+    assert limiter.try_acquire("url") == 0
+    assert limiter.try_acquire("url") == pytest.approx(0.5)
+    assert limiter.try_acquire("other url") == 0
+
+    clock[0] += 0.5
+    assert limiter.try_acquire("url") == 0
+    assert limiter.try_acquire("url") == pytest.approx(0.5)
+
+    clock[0] += 10
+    assert limiter.try_acquire("url") == 0
+    assert limiter.try_acquire("url") == 0
+    assert limiter.try_acquire("url") > 0
+
+
+def test_rate_limiter_shared(clock, tmp_path):
+    """Test that limiters sharing a directory share their buckets."""
+    limiter = RateLimiter(rate=1, shared=True, directory=tmp_path)
+    assert limiter.try_acquire("url") == 0
+    assert RateLimiter(rate=1, shared=True, directory=tmp_path).try_acquire("url") == 1
+    assert RateLimiter(rate=1).try_acquire("url") == 0
+
+
+def test_rate_limiter_acquire(clock, monkeypatch):
+    """Test waiting for tokens."""
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr("time.sleep", sleep)
+    limiter = RateLimiter(rate=4)
+    assert all(limiter.acquire("url") for _ in range(3))
+    assert sleeps == [0.25, 0.25]
+    assert not limiter.acquire("url", timeout=0.1)
+
+
+def test_request_rate_limited(feed_server, monkeypatch):
+    """Test that rate limited requests are served from the last response."""
+    monkeypatch.setattr("underground.feed._rate_limiter", RateLimiter(rate=1 / 60))
+    url = metadata.resolve_url("1")
+    assert feed.request(url) == feed_server.content
+    assert feed.request(url) == feed_server.content
+    assert len(feed_server.paths) == 1
+
+
+def test_request_rate_limited_waits(feed_server, monkeypatch):
+    """Test that rate limited requests without a last response wait for a token."""
+    monkeypatch.setattr("underground.feed._rate_limiter", RateLimiter(rate=10))
+    url = metadata.resolve_url("1")
+    start = time.monotonic()
+    for _ in range(3):
+        feed.request(url)
+        feed.clear_cache()
+    assert time.monotonic() - start >= 0.2
+    assert len(feed_server.paths) == 3
+
+
+def test_robust_rate_limited_deadline(feed_server, monkeypatch):
+    """Test that waiting for a token stops at the retry deadline."""
+    monkeypatch.setattr("underground.feed._rate_limiter", RateLimiter(rate=1 / 60))
+    url = metadata.resolve_url("1")
+    feed.request(url)
+    feed.clear_cache()
+
+    start = time.monotonic()
+    with pytest.raises(feed.RateLimitedError):
+        feed.request_robust(url, retry_policy=feed.RetryPolicy(deadline=0.2))
+    assert time.monotonic() - start < 1
+    assert len(feed_server.paths) == 1
+
+
+def test_request_rate_limited_disk_cache(feed_server, monkeypatch, tmp_path):
+    """Test that waiting for a token does not hold the disk cache lock."""
+    cache = DiskCache(ttl=0, directory=tmp_path)
+    monkeypatch.setattr("underground.feed._disk_cache", cache)
+    monkeypatch.setattr("underground.feed._rate_limiter", RateLimiter(rate=2))
+    url = metadata.resolve_url("1")
+    feed.request(url)
+    feed.clear_cache()
+
+    thread = threading.Thread(target=feed.request, args=(url,))
+    thread.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    with cache.lock(url):
+        assert time.monotonic() - start < 0.2
+    thread.join()
+    assert len(feed_server.paths) == 2
+
+
+@pytest.mark.parametrize("burst", [1, 2])
+def test_request_hedged_rate_limited(feed_server, monkeypatch, burst):
+    """Test that hedged requests are only sent if the rate limit allows them."""
+    monkeypatch.setattr("underground.feed._hedge_policy", None)
+    monkeypatch.setattr("underground.feed._rate_limiter", RateLimiter(rate=1 / 60, burst=burst))
+    feed.set_hedge_policy(feed.HedgePolicy(delay=0.1))
+    feed_server.delays = [0.5]
+
+    assert feed.request("1") == feed_server.content
+    assert len(feed_server.paths) == burst
+
+
+def test_cli_rate_limit(monkeypatch):
+    """Test that the rate limit option sets a shared limiter for the command only."""
+    limiters = []
+    monkeypatch.setattr(
+        "underground.feed.request_robust", lambda **kw: limiters.append(feed._rate_limiter) or b""
+    )
+
+    runner = CliRunner()
+    assert runner.invoke(feed_cli.main, ["1", "--rate-limit", "0.5"]).exit_code == 0
+    assert runner.invoke(feed_cli.main, ["1", "--rate-limit", "0"]).exit_code == 2
+    assert limiters[0].rate == 0.5 and limiters[0].directory is not None
+    assert len(limiters) == 1
+    assert feed._rate_limiter is None
@@ -0,0 +1,124 @@
+"""Test the resilience submodule."""
+
+import pytest
+
+from underground import feed, metadata
+from underground.resilience import CircuitBreaker, CircuitOpenError, StaleWhileRevalidate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Control the time seen by circuit breakers."""
+    now = [0.0]
+    monkeypatch.setattr("time.monotonic", lambda: now[0])
+    return now
+
+
+def fail():
+    raise ValueError
+
+
+def test_circuit_breaker(clock):
+    """Test that the circuit opens after failures, and closes after a good trial."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    assert breaker.call(lambda: 1) == 1
+
+    for _ in range(2):
+        assert breaker.state == "closed"
+        with pytest.raises(ValueError):
+            breaker.call(fail)
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 1)
+
+    clock[0] = 10
+    assert breaker.state == "half-open"
+    assert breaker.call(lambda: 1) == 1
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_failed_trial(clock):
+    """Test that a failed trial opens the circuit again, and one trial runs at a time."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+
+    clock[0] = 10
+    assert breaker.allow()
+    assert not breaker.allow()  # trial already running
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock[0] = 15
+    assert breaker.state == "open"
+
+
+def test_stale_while_revalidate(feed_server):
+    """Test that stale snapshots are served while they are refreshed."""
+    cache = StaleWhileRevalidate(max_age=0)
+    first = cache.get("1")
+    assert first.url == metadata.resolve_url("1")
+    assert len(feed_server.paths) == 1
+
+    # the snapshot is stale at once, so it is served and refreshed
+    assert cache.get("2") is first
+    assert first.stale
+    cache.join()
+
+    assert len(feed_server.paths) == 2
+    assert cache.get("1") is not first
+
+
+def test_stale_while_revalidate_fresh(feed_server):
+    """Test that fresh snapshots are served without requests."""
+    cache = StaleWhileRevalidate(max_age=60)
+    first = cache.get("1")
+    assert cache.get("1") is first
+    assert not first.stale
+    assert len(feed_server.paths) == 1
+
+
+def test_stale_while_revalidate_outage(feed_server):
+    """Test that the last good snapshot is served through an outage."""
+    cache = StaleWhileRevalidate(max_age=0, failure_threshold=2, retries=0)
+    first = cache.get("1")
+
+    feed_server.queue(metadata.ROUTE_FEED_MAP["1"], b"", b"", b"")
+    for _ in range(4):
+        assert cache.get("1") is first
+        cache.join()
+
+    # two failures open the circuit, and the feed is left alone
+    url = metadata.resolve_url("1")
+    assert len(feed_server.paths) == 3
+    assert cache.breakers[url].state == "open"
+    assert isinstance(cache.errors[url], feed.EmptyFeedError)
+
+
+def test_stale_while_revalidate_max_stale(feed_server):
+    """Test that snapshots past max_stale are not served."""
+    cache = StaleWhileRevalidate(max_age=0, max_stale=0, retries=0)
+    first = cache.get("1")
+
+    feed_server.queue(metadata.ROUTE_FEED_MAP["1"], b"")
+    with pytest.raises(feed.EmptyFeedError):
+        cache.get("1")
+    assert cache.get("1") is not first
+
+
+def test_circuit_breaker_interrupted_trial(clock):
+    """Test that a trial interrupted by a BaseException does not block later trials."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    clock[0] = 10
+    with pytest.raises(KeyboardInterrupt):
+        breaker.call(interrupt)
+    assert breaker.state == "half-open"
+    assert breaker.call(lambda: 1) == 1
+    assert breaker.state == "closed"
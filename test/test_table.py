@@ -0,0 +1,85 @@
+"""Test the stop time table submodule."""
+
+import os
+
+import numpy as np
+import pytest
+
+from underground import SubwayFeed, table
+
+from . import DATA_DIR, TEST_PROTOBUFS
+
+
+@pytest.mark.parametrize("filename", TEST_PROTOBUFS)
+def test_matches_stop_dict(filename):
+    """Test that the table holds the same stop times as the stop dict."""
+    with open(os.path.join(DATA_DIR, filename), "rb") as file:
+        feed = SubwayFeed.from_protobuf(file.read())
+
+    stop_time_table = feed.to_stop_time_table()
+    assert not stop_time_table.stalled.any()
+
+    route_ids = stop_time_table.route_ids[stop_time_table.route]
+    stop_ids = stop_time_table.stop_ids[stop_time_table.stop]
+    stops = {}
+    for route_id, stop_id, time in zip(route_ids, stop_ids, stop_time_table.time):
+        stops.setdefault(route_id, {}).setdefault(stop_id, []).append(int(time))
+
+    expected = {
+        route_id: {
+            stop_id: [int(x.timestamp()) for x in times] for stop_id, times in route_stops.items()
+        }
+        for route_id, route_stops in feed.extract_stop_dict().items()
+    }
+    assert stops == expected
+
+
+def test_columns():
+    """Test the table columns on sample data."""
+    sample_data = {
+        "header": {"gtfs_realtime_version": "1.0", "timestamp": 1},
+        "entity": [
+            {
+                "id": "1",
+                "trip_update": {
+                    "trip": {"trip_id": "X", "start_date": "20190726", "route_id": "1"},
+                    "stop_time_update": [
+                        {"arrival": {"time": 0}, "stop_id": "IGNORED"},
+                        {"arrival": {"time": 1}, "departure": {"time": 2}, "stop_id": "ONE"},
+                        {"arrival": {"time": 3}, "stop_id": "TWO"},
+                    ],
+                },
+            },
+        ],
+    }
+    stop_time_table = SubwayFeed(**sample_data).to_stop_time_table()
+    assert len(stop_time_table) == 2
+    assert stop_time_table.stop_ids.tolist() == ["ONE", "TWO"]
+    assert stop_time_table.arrival.tolist() == [1, 3]
+    assert stop_time_table.departure.tolist() == [2, table.MISSING_TIME]
+    assert stop_time_table.time.tolist() == [2, 3]
+    assert stop_time_table.time.dtype == np.int64
+
+
+def test_stalled():
+    """Test that stalled trains are skipped, or flagged if included."""
+    trip = {"trip_id": "X", "start_date": "20190726", "route_id": "1"}
+    sample_data = {
+        "header": {"gtfs_realtime_version": "1.0", "timestamp": 1000},
+        "entity": [
+            {
+                "id": "1",
+                "trip_update": {
+                    "trip": trip,
+                    "stop_time_update": [{"arrival": {"time": 2000}, "stop_id": "ONE"}],
+                },
+            },
+            {"id": "2", "vehicle": {"trip": trip, "timestamp": 0}},
+        ],
+    }
+    feed = SubwayFeed(**sample_data)
+    assert len(feed.to_stop_time_table()) == 0
+    assert len(feed.to_stop_time_table(stalled_timeout=0)) == 1
+
+    stop_time_table = feed.to_stop_time_table(include_stalled=True)
+    assert stop_time_table.stalled.tolist() == [True]